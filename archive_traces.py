@@ -7,9 +7,13 @@ import urllib.error
 import logging
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pyppeteer import launch
 from pyppeteer import errors
 
+# Number of availability checks running at the same time
+MAX_WORKERS = 16
+
 def create_with_csv(csv_in_name, csv_out_name, trace_out_path, timeout_duration):
     """Extracts a trace file using the input csv file with current urls.
     
@@ -28,25 +32,33 @@ def create_with_csv(csv_in_name, csv_out_name, trace_out_path, timeout_duration)
 
     with open(csv_in_name, 'r') as csv_file_in:
         csv_reader = csv.reader(csv_file_in)
-        with open(csv_out_name, 'w+') as csv_file_out:
-            csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-            csv_writer.writerow(["archive_id", "url_id", "date", "archive_url", "site_status", "site_message", "extraction_message"])
 
-            # Skip the header of the CSV
-            next(csv_reader)
+        # Skip the header of the CSV
+        next(csv_reader)
+
+        lines = list(csv_reader)
+
+    # The availability of the urls is checked concurrently, results come back in input order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        availability = list(executor.map(check_site_availability, [line[3] for line in lines]))
 
-            for line in csv_reader:
-                archive_id = line[0]
-                url_id = line[1]
-                date = line[2]
-                url = line[3]
+    with open(csv_out_name, 'w+') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+        csv_writer.writerow(["archive_id", "url_id", "date", "archive_url", "site_status", "site_message", "extraction_message"])
 
-                print("url #{0} {1}".format(url_id, url))
-                logging.info("url #{0} {1}".format(url_id, url))
+        for line, (site_status, site_message) in zip(lines, availability):
+            archive_id = line[0]
+            url_id = line[1]
+            date = line[2]
+            url = line[3]
 
-                site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, date, trace_out_path, timeout_duration)
+            print("url #{0} {1}".format(url_id, url))
+            logging.info("url #{0} {1}".format(url_id, url))
 
-                csv_writer.writerow([archive_id, url_id, date, url, site_status, site_message, extraction_message])
+            site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, date, site_status,
+                                                                           site_message, trace_out_path, timeout_duration)
+
+            csv_writer.writerow([archive_id, url_id, date, url, site_status, site_message, extraction_message])
 
 def create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv):
     """Extracts trace files using the input database file with archive urls.
@@ -68,12 +80,16 @@ def create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv):
     connection.commit()
     results = cursor.fetchall()
 
+    # The availability of the urls is checked concurrently, results come back in input order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        availability = list(executor.map(check_site_availability, [row[3] for row in results]))
+
     if make_csv:
         csv_file_out = open(csv_out_name, "w+")
         csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
         csv_writer.writerow(["archive_id", "url_id", "date", "archive_url", "site_status", "site_message", "extraction_message"])
     
-    for row in results:
+    for row, (site_status, site_message) in zip(results, availability):
         archive_id = str(row[0])
         url_id = str(row[1])
         date = row[2]
@@ -82,18 +98,20 @@ def create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv):
         print("url #{0} {1}".format(url_id, url))
         logging.info("url #{0} {1}".format(url_id, url))
 
-        site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, date, trace_out_path, timeout_duration)
+        site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, date, site_status,
+                                                                       site_message, trace_out_path, timeout_duration)
 
         if make_csv:
             csv_writer.writerow([archive_id, url_id, date, url, site_status, site_message, extraction_message])
 
-        cursor.execute('INSERT INTO archive_trace_status VALUES ({0}, {1}, "{2}", "{3}", "{4}", "{5}", "{6}")'\
-                      .format(archive_id, url_id, date, url, site_status, site_message, extraction_message))
+        # Placeholders let SQLite reuse the prepared statement, extraction errors are stored as their message
+        cursor.execute("INSERT INTO archive_trace_status VALUES (?, ?, ?, ?, ?, ?, ?);",
+                       (row[0], row[1], date, url, site_status, site_message, str(extraction_message)))
 
     connection.commit()
     connection.close()
 
-def extract_traces(url, archive_id, url_id, date, trace_out_path, timeout_duration):
+def extract_traces(url, archive_id, url_id, date, site_status, site_message, trace_out_path, timeout_duration):
     """Fetches url from input CSV and extract trace file
     
     Parameters
@@ -106,6 +124,10 @@ def extract_traces(url, archive_id, url_id, date, trace_out_path, timeout_durati
         The url ID.
     date : str
         The date of the archive capture.
+    site_status : str
+        The site status from check_site_availability.
+    site_message : str
+        The site message from check_site_availability.
     trace_out_path : str
         The directory to store the trace files.
     timeout_duration : str
@@ -113,8 +135,6 @@ def extract_traces(url, archive_id, url_id, date, trace_out_path, timeout_durati
 
     """
 
-    site_status, site_message = check_site_availability(url)
-
     if site_status == "FAIL":
         return site_status, site_message, "Extraction unsuccessful"
     elif site_status == "REDIRECT":
@@ -360,7 +380,7 @@ def connect_sql(path):
         results = cursor.fetchall()
 
         for row in results:
-            cursor.execute("DELETE FROM archive_trace_status WHERE archiveID = {};".format(row[0]))
+            cursor.execute("DELETE FROM archive_trace_status WHERE archiveID = ?;", (row[0],))
         connection.commit()
 
     else:
@@ -1,45 +1,32 @@
 import sqlite3
 import argparse
 import csv
-from fuzzywuzzy import fuzz
+import io
+import os
+import contextlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
 
+# Fail at import instead of silently falling back to the pure python scorers when the
+# compiled rapidfuzz extension is missing
+os.environ.setdefault("RAPIDFUZZ_IMPLEMENTATION", "cpp")
+from rapidfuzz import fuzz
 
-def find_different_requests(request_pair):
-    """Checks if the status code of both current and archive URL match.
 
-    Parameters
-    ----------
-    request_pair : tuple
-        Tuple containing a single current network request info in the first index and 
-        a single archive network request info in the second index.
-
-    """
-
-    c_request = request_pair[0]
-    a_request = request_pair[1]
-    c_status = c_request["status_code"]
-    a_status = a_request["status_code"]
-	
-    # we do not consider redirects with status 302 to be errors
-    if(c_status!= a_status) and (a_status!="302") and (c_status!="302"):
-        #print("Difference found!")
-        print(c_request["url"], c_status, a_request["url"], a_status)
-        return True
-    else:
-        return False
-
-def check_archive_specific_url(dict_obj):
+def check_archive_specific_url(request):
     """Checks if network request URL is archive-it specific. If it is, remove it from the list.
 
     Parameters
     ----------
-    dict_obj : dict
-        The dictionary object containing info related to one network request.
+    request : tuple
+        The (url, status_code) of one network request.
 
     """
 
     # URL of each network request
-    url = dict_obj["url"]
+    url = request[0]
 
     # Filtering out archive-it specific URLs'
     if "partner.archive-it.org" in url:
@@ -48,106 +35,289 @@ def check_archive_specific_url(dict_obj):
     else:
         return True
 
-def open_with_csv(index_file_name, curr_requests_path, arch_requests_path, csv_out_name, do_print):
-    """Parses both index files line by line and writes the urls and file names to the output file.
-   
+def read_requests(file_name):
+    """Reads the URL and status code of every network request in a CSV file.
+
     Parameters
     ----------
-    index_file_name : str
-        The CSV file that maps the current network requests to their archived counterparts.
-    curr_csv_path : str
+    file_name : str
+        The CSV file containing the network requests.
+
+    Returns
+    -------
+    list
+        A (url, status_code) tuple for each network request.
+
+    """
+
+    with open(file_name) as requests_file:
+        requests_reader = csv.reader(requests_file)
+
+        # Locate the columns from the header
+        header = next(requests_reader)
+        url_index = header.index("url")
+        status_index = header.index("status_code")
+
+        return [(row[url_index], row[status_index]) for row in requests_reader]
+
+def trigrams(url):
+    """Gets the distinct trigrams of a URL.
+
+    Parameters
+    ----------
+    url : str
+        The lowercased URL.
+
+    Returns
+    -------
+    set
+        Every three character substring of the URL.
+
+    """
+
+    return {url[i:i + 3] for i in range(len(url) - 2)}
+
+def find_matching_requests(a_urls, c_urls, c_url_index, c_trigram_index):
+    """Finds the current network request matching each archive network request.
+
+    Exact and substring matches are looked up first, only the remaining archive URLs
+    are scored with a fuzzy match against the current URLs sharing enough trigrams.
+
+    Parameters
+    ----------
+    a_urls : list
+        The lowercased archive network request URLs.
+    c_urls : list
+        The lowercased current network request URLs.
+    c_url_index : dict
+        Maps each lowercased current URL to the index of its first occurrence in c_urls.
+    c_trigram_index : tuple
+        The trigram index of the current URLs built by index_trigrams.
+
+    Returns
+    -------
+    list
+        The index of the matching current network request for each archive URL, None if
+        no match was found.
+
+    """
+
+    match_indices = [None] * len(a_urls)
+    c_postings, c_lengths, c_num_trigrams = c_trigram_index
+
+    for i, a_url in enumerate(a_urls):
+        if a_url in c_url_index:
+            match_indices[i] = c_url_index[a_url]
+            continue
+
+        # Archived URLs usually embed the current URL after the Wayback prefix
+        match_indices[i] = next((j for c_url, j in c_url_index.items()
+                                 if c_url in a_url or a_url in c_url), None)
+
+        if match_indices[i] is not None:
+            continue
+
+        # Count the trigrams shared with every current URL
+        a_trigrams = trigrams(a_url)
+        postings = [c_postings[t] for t in a_trigrams if t in c_postings]
+        shared = np.bincount(np.concatenate(postings), minlength=len(c_urls)) if postings \
+            else np.zeros(len(c_urls), dtype=int)
+
+        # partial_ratio aligns the shorter URL against the longer one. Above 90 the indel
+        # distance of that alignment is below a fifth of the shorter length, and every
+        # edit removes at most three of its trigrams, so pairs sharing fewer trigrams
+        # can never match and are not scored
+        a_shorter = len(a_url) <= c_lengths
+        min_shared = np.where(a_shorter, len(a_trigrams) - 0.6 * len(a_url),
+                              c_num_trigrams - 0.6 * c_lengths)
+
+        # Candidates are scored in order so the first match is kept
+        for j in np.flatnonzero(shared >= min_shared):
+            if fuzz.partial_ratio(a_url, c_urls[j], score_cutoff=90) > 90:
+                match_indices[i] = int(j)
+                break
+
+    return match_indices
+
+def index_trigrams(c_urls):
+    """Builds an inverted index from trigrams to the current URLs containing them.
+
+    Parameters
+    ----------
+    c_urls : list
+        The lowercased current network request URLs.
+
+    Returns
+    -------
+    tuple
+        A dict mapping each trigram to the array of indices of the URLs containing it,
+        the length of each URL, and the number of distinct trigrams of each URL.
+
+    """
+
+    postings = {}
+    num_trigrams = []
+
+    for j, c_url in enumerate(c_urls):
+        c_trigrams = trigrams(c_url)
+        num_trigrams.append(len(c_trigrams))
+
+        for t in c_trigrams:
+            postings.setdefault(t, []).append(j)
+
+    postings = {t: np.array(indices, dtype=int) for t, indices in postings.items()}
+    lengths = np.array([len(c_url) for c_url in c_urls], dtype=int)
+
+    return postings, lengths, np.array(num_trigrams, dtype=int)
+
+@functools.lru_cache(maxsize=64)
+def read_current_requests(file_name):
+    """Reads a current network requests file and prepares its URLs for matching.
+
+    Every capture of a url is compared against the same current requests file, so the
+    result is cached and each worker process only reads and lowercases a file the first
+    time it sees it.
+
+    Parameters
+    ----------
+    file_name : str
+        The CSV file containing the current network requests.
+
+    Returns
+    -------
+    tuple
+        The (url, status_code) tuple of each network request, the lowercased URLs, a dict
+        mapping each lowercased URL to the index of its first occurrence, and the trigram
+        index of the lowercased URLs.
+
+    """
+
+    curr_requests_data = read_requests(file_name)
+    c_urls = [c_request[0].lower() for c_request in curr_requests_data]
+    c_url_index = {}
+
+    for j, c_url_low in enumerate(c_urls):
+        c_url_index.setdefault(c_url_low, j)
+
+    return curr_requests_data, c_urls, c_url_index, index_trigrams(c_urls)
+
+def compare_requests(request_file, curr_requests_path, arch_requests_path):
+    """Compares the network requests of a current URL to the ones of an archive URL.
+
+    Parameters
+    ----------
+    request_file : list
+        The row of the index file with the current URL, archive URL, and the file names
+        of their network requests.
+    curr_requests_path : str
     	The directory containing the CSV files with the current websites' network requests.
-    arch_out_path : str
+    arch_requests_path : str
     	The directory containing the CSV files with the archived websites' network requests.
-    csv_out_name : str
-        The CSV file to write the file with the combined requests.
-    do_print : bool
-    	Whether or not to print the results to stdout.
-		
+
+    Returns
+    -------
+    str
+        Everything printed during the comparison.
+
     """
-	
-    # Read the index file 
-    index_lst = []
-    index_file = open(index_file_name, 'r')
-    index_reader = csv.reader(index_file, delimiter=',')
-	
-    # Skip the headers
-    next(index_reader, None)
 
-    for column in index_reader:
-        index_lst.append(column)
+    output = io.StringIO()
 
-    index_file.close()
-    print("Index file has been read")
-	
-    for request_file in index_lst:
+    with contextlib.redirect_stdout(output):
         c_url = request_file[0]
         a_url = request_file[1]
         c_file_name = request_file[2]
         a_file_name = request_file[3]
-		
-        # Read the csv files as dicts
-        with open(arch_requests_path + "/" + a_file_name) as a_input:
-            a_input_file = csv.DictReader(a_input)
-            arch_requests_data = [row for row in a_input_file]
 
-            # Close file
-            a_input.close()
-	
-        with open(curr_requests_path + "/" + c_file_name) as c_input:
-            c_input_file = csv.DictReader(c_input)
-            curr_requests_data = [row for row in c_input_file]
-	    
-            # Close file
-            c_input.close()
-		
+        arch_requests_data = read_requests(arch_requests_path + "/" + a_file_name)
+
+        curr_requests_data, c_urls, c_url_index, c_trigram_index = read_current_requests(curr_requests_path + "/" + c_file_name)
+
         num_differences = 0
         missing_requests = 0
-	
+
         print("Comparing ", c_file_name, " to ", a_file_name)
 
         # Filter out archive specific URLS
         arch_requests_data = list(filter(check_archive_specific_url, arch_requests_data))
 
-        for a_row in arch_requests_data:
-            a_url = a_row["url"]
-	    #print("Archived url: ", a_url)
-	    #find the matching element in list of current network requests, from here:
-	    #https://stackoverflow.com/questions/8653516/python-list-of-dictionaries-search
-	    #a_row = list(filter(lambda a_request: (c_url in a_request["url"]), arch_requests_data))
-			
-            c_row = list(filter(lambda c_request: (fuzz.partial_ratio(a_url.lower(),c_request["url"].lower())>90), curr_requests_data))
-	    
-            if c_row: 
-	    	#print("Match found!")
-		#print("Current: ", c_url)
-		#print("Archived: ", a_row[0]["url"])
-                c_url = c_row[0]["url"]
-                request_pair = (c_row[0], a_row)
-		
-                # Checks if status code are different between two requests
-                if find_different_requests(request_pair):
+        # Lowercase every URL once before matching
+        a_urls = [a_row[0].lower() for a_row in arch_requests_data]
+        match_indices = find_matching_requests(a_urls, c_urls, c_url_index, c_trigram_index)
+
+        for (a_url, a_status), match_index in zip(arch_requests_data, match_indices):
+            if match_index is not None:
+                c_url, c_status = curr_requests_data[match_index]
+
+                # Checks if status code are different between two requests,
+                # we do not consider redirects with status 302 to be errors
+                if (c_status != a_status) and (a_status != "302") and (c_status != "302"):
+                    print(c_url, c_status, a_url, a_status)
                     num_differences = num_differences + 1
 
             else:
                 print("Archived request not found: ", a_url)
                 missing_requests = missing_requests + 1
-	
+
         # Number of differences between current and archived website
         if num_differences > 0:
             print("There are {} differences between the current and archived websites".format(num_differences))
         else:
             print("No differences found")
-			
+
         # 
         if missing_requests > 0:
             print("There are {} requests in the archived site that are not present in the current site".format(missing_requests))
         else:
             print("No missing requests found")
-			
-        int_correspondence = (len(arch_requests_data)-missing_requests-num_differences)/len(arch_requests_data)
-        print("Interactional correspondence: ", int_correspondence)
-		    	
+
+        # An archive file with no requests left has nothing to correspond to
+        if arch_requests_data:
+            int_correspondence = (len(arch_requests_data)-missing_requests-num_differences)/len(arch_requests_data)
+            print("Interactional correspondence: ", int_correspondence)
+        else:
+            print("No archived requests to compare, interactional correspondence not computed")
+
+    return output.getvalue()
+
+def open_with_csv(index_file_name, curr_requests_path, arch_requests_path, csv_out_name, do_print):
+    """Parses both index files line by line and writes the urls and file names to the output file.
+   
+    Parameters
+    ----------
+    index_file_name : str
+        The CSV file that maps the current network requests to their archived counterparts.
+    curr_csv_path : str
+    	The directory containing the CSV files with the current websites' network requests.
+    arch_out_path : str
+    	The directory containing the CSV files with the archived websites' network requests.
+    csv_out_name : str
+        The CSV file to write the file with the combined requests.
+    do_print : bool
+    	Whether or not to print the results to stdout.
+		
+    """
+	
+    # Read the index file 
+    index_lst = []
+    index_file = open(index_file_name, 'r')
+    index_reader = csv.reader(index_file, delimiter=',')
+	
+    # Skip the headers
+    next(index_reader, None)
+
+    for column in index_reader:
+        index_lst.append(column)
+
+    index_file.close()
+    print("Index file has been read")
+
+    # Pairs are compared in separate processes, their output is printed in index order
+    with ProcessPoolExecutor() as executor:
+        for output in executor.map(compare_requests, index_lst, repeat(curr_requests_path),
+                                   repeat(arch_requests_path)):
+            print(output, end='')
+
 def parse_args():
     """Parses the command line arguments
 
@@ -210,4 +380,5 @@ def main():
     index_file_name, curr_requests_path, arch_requests_path, do_print, csv_out_name = parse_args()
     open_with_csv(index_file_name, curr_requests_path, arch_requests_path, csv_out_name, do_print)
 
-main()
+if __name__ == "__main__":
+    main()
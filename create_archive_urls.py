@@ -2,7 +2,90 @@ import argparse
 import sqlite3
 import csv
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+
+# Number of timemaps fetched at the same time
+MAX_WORKERS = 32
+
+
+def create_session():
+    """Creates a session that retries failed requests, with a connection pool large enough
+    for every worker thread. """
+
+    retry_options = {"total": 5, "backoff_factor": 1, "status_forcelist": [429, 500, 502, 503, 504]}
+    retry_methods = frozenset({"HEAD", "GET", "OPTIONS"})
+
+    # method_whitelist was renamed to allowed_methods in urllib3 1.26 and removed in 2.0
+    try:
+        retry_strategy = Retry(allowed_methods=retry_methods, **retry_options)
+    except TypeError:
+        retry_strategy = Retry(method_whitelist=retry_methods, **retry_options)
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy, pool_connections=MAX_WORKERS,
+                                            pool_maxsize=MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def find_archive_urls(session, archive_id, url, remove_banner):
+    """Finds the date and archive url of every capture of a url.
+
+    Parameters
+    ----------
+    session : requests.Session
+        The session shared by the worker threads.
+    archive_id : str
+        The archive ID.
+    url : str
+        The current url.
+    remove_banner : bool
+        Whether or not to generate urls that include Archive-It banner.
+
+    Returns
+    -------
+    list
+        A (date, archive_url) tuple for each capture of the url, empty if the timemap could not
+        be fetched.
+
+    """
+
+    prefix = "https://wayback.archive-it.org/{0}".format(archive_id)
+    request_url = "{0}/timemap/cdx".format(prefix)
+    captures = []
+
+    # Only the date changes between the archive urls of a capture, build the rest once
+    # (add if_ into archive url if remove_banner is true)
+    url_head = prefix + "/"
+    url_tail = ("if_/" if remove_banner else "/") + url
+
+    # The timemap has one capture timestamp per line, parse it as it arrives
+    try:
+        with session.get(request_url, params={"url": url, "fl": "timestamp"}, stream=True) as response:
+            # Error statuses the session does not retry (ex. 403 for a private collection) still have a body
+            response.raise_for_status()
+            response.encoding = response.encoding or "utf-8"
+
+            for date in response.iter_lines(decode_unicode=True):
+                if not date:
+                    continue
+
+                # Anything other than a 14 digit timestamp means this is not a timemap (ex. an error page)
+                if len(date) != 14 or not date.isdigit():
+                    print("Failed to get the captures of {0}: unexpected timemap line {1!r}".format(url, date))
+                    return []
+
+                captures.append((date, "".join((url_head, date, url_tail))))
+
+    # Once the retries are exhausted the url is written without captures instead of aborting the run
+    except requests.RequestException as e:
+        print("Failed to get the captures of {0}: {1}".format(url, e))
+        return []
+
+    return captures
 
 
 def create_with_db(make_csv, csv_out_name, remove_banner):
@@ -26,50 +109,34 @@ def create_with_db(make_csv, csv_out_name, remove_banner):
     if make_csv:
         csv_file_out = open(csv_out_name, "w+")
         csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-        csv_writer.writerow(["archive_id", "url_id", "archive_url"])
-
-    for row in results:
-        archive_id = str(row[0])
-        url_id = str(row[1])
-        url = row[2]
-
-        archive_url = "https://wayback.archive-it.org/{0}/*/{1}".format(archive_id, url)
-
-        print("url #" + url_id)
-
-        # get external link to each capture                                                                                        
-        found = False
-        page = requests.get(archive_url)                # next 7 lines just go through the html to find the urls
-        soup = BeautifulSoup(page.content, features='html.parser')
-        for htmltd in soup.findAll('td'):
-            htmlclass = htmltd.get('class')
-            if htmlclass is not None:
-                if htmlclass[0] == "mainBody":
-                    for htmla in htmltd.findAll('a'):
-                        found_url = htmla.get('href')
-                        date = found_url.split('/')[4]
-
-                        if remove_banner:       # add if_ into url if remove_banner is true
-                            index = found_url.find('/', 40)
-                            final_url = found_url[:index] + "if_" + found_url[index:]
-                        else:
-                            final_url = found_url
-
-                        cursor.execute("insert into archive_urls values ({0}, {1}, '{2}', '{3}');"
-                                       .format(archive_id, url_id, date, final_url))        # insert into db
-
-                        if make_csv:
-                            csv_writer.writerow([archive_id, url_id, date, final_url])
-                        
-                        found = True
-
-        if not found:
-            cursor.execute("insert into archive_urls values({0}, {1}, NULL, NULL);".format(archive_id, url_id))
-            if make_csv:
-                csv_writer.writerow([archive_id, url_id, "", ""])
-
-        page.close()
-        connection.commit()
+        csv_writer.writerow(["archive_id", "url_id", "date", "archive_url"])
+
+    session = create_session()
+
+    # The timemaps are fetched concurrently, results come back in input order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        all_captures = executor.map(lambda row: find_archive_urls(session, str(row[0]), row[2], remove_banner),
+                                    results)
+
+        for row, captures in zip(results, all_captures):
+            archive_id = str(row[0])
+            url_id = str(row[1])
+
+            print("url #" + url_id)
+
+            for date, final_url in captures:
+                cursor.execute("insert into archive_urls values ({0}, {1}, '{2}', '{3}');"
+                               .format(archive_id, url_id, date, final_url))        # insert into db
+
+                if make_csv:
+                    csv_writer.writerow([archive_id, url_id, date, final_url])
+
+            if not captures:
+                cursor.execute("insert into archive_urls values({0}, {1}, NULL, NULL);".format(archive_id, url_id))
+                if make_csv:
+                    csv_writer.writerow([archive_id, url_id, "", ""])
+
+            connection.commit()
 
     connection.close()
     if make_csv:
@@ -92,47 +159,33 @@ def create_with_csv(csv_out_name, csv_in_name, remove_banner):
 
     with open(csv_in_name, 'r') as csv_file_in:
         csv_reader = csv.reader(csv_file_in)
-        with open(csv_out_name, 'w+') as csv_file_out:
-            csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-            csv_writer.writerow(["archive_id", "url_id", "archive_url"])
-
-            count = 0
-            for line in csv_reader:
-                if count == 0:      # skip the header
-                    count += 1
-                    continue
 
+        # Skip the header
+        next(csv_reader)
+        lines = list(csv_reader)
+
+    session = create_session()
+
+    with open(csv_out_name, 'w+') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+        csv_writer.writerow(["archive_id", "url_id", "date", "archive_url"])
+
+        # The timemaps are fetched concurrently, results come back in input order
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            all_captures = executor.map(lambda line: find_archive_urls(session, line[0], line[2], remove_banner),
+                                        lines)
+
+            for line, captures in zip(lines, all_captures):
                 archive_id = line[0]
                 url_id = line[1]
-                url = line[2]
-                archive_url = "https://wayback.archive-it.org/{0}/*/{1}".format(archive_id, url)
 
                 print("url #" + url_id)
 
-                found = False  # next 15 lines just goes through the html to find the urls
-                page = requests.get(archive_url)
-                soup = BeautifulSoup(page.content, features='html.parser')
-                for htmltd in soup.findAll('td'):
-                    htmlclass = htmltd.get('class')
-                    if htmlclass is not None:
-                        if htmlclass[0] == "mainBody":
-                            for htmla in htmltd.findAll('a'):
-                                found_url = htmla.get('href')
-                                date = found_url.split('/')[4]
-
-                                if remove_banner:       # add if_ into archive url if remove_banner is true
-                                    index = found_url.find('/', 40)
-                                    final_url = found_url[:index] + "if_" + found_url[index:]
-                                else:
-                                    final_url = found_url
-
-                                csv_writer.writerow([archive_id, url_id, date, final_url])
-
-                                found = True
-                if not found:
-                    csv_writer.writerow([archive_id, url_id, "", ""])
+                for date, final_url in captures:
+                    csv_writer.writerow([archive_id, url_id, date, final_url])
 
-                page.close()
+                if not captures:
+                    csv_writer.writerow([archive_id, url_id, "", ""])
 
 
 def parse_args():
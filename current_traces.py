@@ -2,19 +2,34 @@ import argparse
 import csv
 import asyncio
 import sqlite3
-import urllib.request
-import urllib.error
 import logging
+import logging.handlers
+import queue
 import time
 import os
-from pyppeteer import launch
-from pyppeteer import errors
+import shutil
+import sys
+import contextlib
+import aiohttp
 
-def create_with_csv(csv_in_name, csv_out_name, trace_out_path, timeout_duration):
+# Number of urls extracted at the same time
+MAX_CONCURRENCY = 8
+
+# Number of availability checks of unreachable urls running at the same time
+MAX_AVAILABILITY_CHECKS = 100
+
+# Number of trace statuses inserted into the database at a time
+INSERT_BATCH_SIZE = 100
+
+async def create_with_csv(browsers, session, csv_in_name, csv_out_name, trace_out_path, timeout_duration):
     """Extracts a trace file using the input csv file with current urls.
     
     Parameters
     ----------
+    browsers : asyncio.Queue
+        The idle browsers.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the urls.
     csv_in_name : str
         The CSV file with the current urls.
     csv_out_name : str
@@ -26,32 +41,38 @@ def create_with_csv(csv_in_name, csv_out_name, trace_out_path, timeout_duration)
 
     """
 
-    with open(csv_in_name, 'r') as csv_file_in:
+    with open(csv_in_name, 'r', newline='', buffering=1048576) as csv_file_in:     # 1 MiB buffer
         csv_reader = csv.reader(csv_file_in)
-        with open(csv_out_name, 'w+') as csv_file_out:
-            csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-            csv_writer.writerow(["archive_id", "url_id", "current_url", "site_status", "site_message", "extraction_message"])
 
-            # Skip the header of the CSV
-            next(csv_reader)
+        # Skip the header of the CSV
+        next(csv_reader)
 
-            for line in csv_reader:
-                archive_id = line[0]
-                url_id = line[1]
-                url = line[2]
+        lines = list(csv_reader)
 
-                print("url #{0} {1}".format(url_id, url))
-                logging.info("url #{0} {1}".format(url_id, url))
+    # The output is open before the extraction starts so an interrupted run keeps the finished rows
+    with open(csv_out_name, 'w', newline='', buffering=1048576) as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+        csv_writer.writerow(["archive_id", "url_id", "current_url", "site_status", "site_message", "extraction_message"])
 
-                site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, trace_out_path, timeout_duration)
+        statuses = extract_all_traces(browsers, session, [(line[2], line[0], line[1]) for line in lines],
+                                      trace_out_path, timeout_duration)
 
-                csv_writer.writerow([archive_id, url_id, url, site_status, site_message, extraction_message])
+        # Each row is written as soon as its url and the ones before it are extracted, keeping the input order
+        try:
+            for line, status in zip(lines, statuses):
+                csv_writer.writerow(line[:3] + list(await status))
+        finally:
+            cancel_all(statuses)        # only left running if the run was interrupted
 
-def create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv):
+async def create_with_db(browsers, session, csv_out_name, trace_out_path, timeout_duration, make_csv):
     """Extracts trace files using the input database file with current urls.
 
     Parameters
     ----------
+    browsers : asyncio.Queue
+        The idle browsers.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the urls.
     csv_out_name : str
         The CSV file to write the extracton status of the urls.
     trace_out_path : str
@@ -63,39 +84,217 @@ def create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv):
 
     """
 
-    cursor.execute("SELECT * FROM current_urls;")
-    connection.commit()
-    results = cursor.fetchall()
-
-    if make_csv:
-        csv_file_out = open(csv_out_name, "w+")
-        csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-        csv_writer.writerow(["archive_id", "url_id", "current_url", "site_status", "site_message", "extraction_message"])
-    
-    for row in results:
-        archive_id = str(row[0])
-        url_id = str(row[1])
-        url = row[2]
+    results = []
+    urls = []
 
-        print("url #{0} {1}".format(url_id, url))
-        logging.info("url #{0} {1}".format(url_id, url))
+    # Only the needed columns are read, the url of each row is listed as its row arrives
+    for row in cursor.execute("SELECT archiveID, urlID, url FROM current_urls;"):
+        results.append(row)
+        urls.append((row[2], str(row[0]), str(row[1])))
 
-        site_status, site_message, extraction_message = extract_traces(url, archive_id, url_id, trace_out_path, timeout_duration)
+    trace_statuses = []
 
+    with contextlib.ExitStack() as stack:
+        # The output is open before the extraction starts so an interrupted run keeps the finished rows
         if make_csv:
-            csv_writer.writerow([archive_id, url_id, url, site_status, site_message, extraction_message])
+            csv_file_out = stack.enter_context(open(csv_out_name, 'w', newline='', buffering=1048576))   # 1 MiB buffer
+            csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+            csv_writer.writerow(["archive_id", "url_id", "current_url", "site_status", "site_message", "extraction_message"])
+
+        statuses = extract_all_traces(browsers, session, urls, trace_out_path, timeout_duration)
+
+        # Each row is stored as soon as its url and the ones before it are extracted, keeping the input order
+        stack.callback(cancel_all, statuses)        # only left running if the run was interrupted
+
+        for row, status in zip(results, statuses):
+            site_status, site_message, extraction_message = await status
+            archive_id = str(row[0])
+            url_id = str(row[1])
+            url = row[2]
+
+            if make_csv:
+                csv_writer.writerow([archive_id, url_id, url, site_status, site_message, extraction_message])
+
+            # Extraction errors are stored as their message
+            trace_statuses.append((row[0], row[1], url, site_status, site_message, str(extraction_message)))
 
-        cursor.execute('INSERT INTO current_trace_status VALUES ({0}, {1}, "{2}", "{3}", "{4}", "{5}")'\
-                      .format(archive_id, url_id, url, site_status, site_message, extraction_message))
+            # The statuses are inserted in batches with the same prepared statement, each batch in one transaction
+            if len(trace_statuses) >= INSERT_BATCH_SIZE:
+                cursor.executemany("INSERT INTO current_trace_status VALUES (?, ?, ?, ?, ?, ?);", trace_statuses)
+                connection.commit()
+                trace_statuses.clear()
+
+    cursor.executemany("INSERT INTO current_trace_status VALUES (?, ?, ?, ?, ?, ?);", trace_statuses)
 
     connection.commit()
     connection.close()
 
-def extract_traces(url, archive_id, url_id, trace_out_path, timeout_duration):
+def extract_all_traces(browsers, session, urls, trace_out_path, timeout_duration):
+    """Starts extracting the trace files of every url, a url listed several times is only extracted once.
+
+    Parameters
+    ----------
+    browsers : asyncio.Queue
+        The idle browsers.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the urls.
+    urls : list
+        The (url, archive_id, url_id) of each row.
+    trace_out_path : str
+        The directory to store the trace files.
+    timeout_duration : str
+        Duration before timeout when going to each website.
+
+    Returns
+    -------
+    list
+        The asyncio.Future of each row, giving its site status, site message and extraction message.
+
+    """
+
+    extractions = {}
+    statuses = []
+
+    for url, archive_id, url_id in urls:
+        key = url.strip().rstrip('/')
+
+        if key not in extractions:
+            extraction = asyncio.ensure_future(extract_traces(browsers, session, url, archive_id, url_id,
+                                                              trace_out_path, timeout_duration))
+            extractions[key] = (extraction, archive_id, url_id)
+            statuses.append(extraction)
+        else:
+            statuses.append(asyncio.ensure_future(reuse_extraction(*extractions[key], trace_out_path,
+                                                                   archive_id, url_id)))
+
+    # The urls are extracted concurrently, the futures are in input order
+    return statuses
+
+def cancel_all(statuses):
+    """Cancels the extractions that are still running.
+
+    Parameters
+    ----------
+    statuses : list
+        The asyncio.Future of each row, from extract_all_traces.
+
+    """
+
+    for status in statuses:
+        status.cancel()
+
+async def reuse_extraction(extraction, first_archive_id, first_url_id, trace_out_path, archive_id, url_id):
+    """Gives a row the extraction of the first row with the same url.
+
+    Parameters
+    ----------
+    extraction : asyncio.Future
+        The extraction of the first row with the url.
+    first_archive_id : str
+        The archive ID of the first row with the url.
+    first_url_id : str
+        The url ID of the first row with the url.
+    trace_out_path : str
+        The directory to store the trace files.
+    archive_id : str
+        The archive ID.
+    url_id : str
+        The url ID.
+
+    Returns
+    -------
+    tuple
+        The site status, site message and extraction message of the url.
+
+    """
+
+    status = await extraction
+
+    first_trace_path = '{0}{1}.{2}.json'.format(trace_out_path, first_archive_id, first_url_id)
+    trace_path = '{0}{1}.{2}.json'.format(trace_out_path, archive_id, url_id)
+
+    # Every row keeps a trace file of its own, a repeated row with the same IDs already has it
+    if status[2] == "Extraction successful" and trace_path != first_trace_path:
+        shutil.copyfile(first_trace_path, trace_path)
+
+    return status
+
+async def launch_browsers():
+    """Launches the browsers shared by every url of the run.
+
+    Chromium only records one trace at a time per browser, so each url being extracted
+    at the same time gets a browser of its own.
+
+    Returns
+    -------
+    asyncio.Queue
+        The idle browsers.
+
+    """
+
+    # pyppeteer is only imported once there are urls to extract, so --help and argument errors return at once
+    from pyppeteer import launch
+
+    browsers = asyncio.Queue()
+
+    for browser in await asyncio.gather(*[launch(headless=True) for _ in range(MAX_CONCURRENCY)]):
+        browsers.put_nowait(browser)
+
+    return browsers
+
+async def replace_browser(browser):
+    """Launches a fresh browser in place of one left in an unknown state, and closes the old one.
+
+    Parameters
+    ----------
+    browser : pyppeteer.browser.Browser
+        The browser to replace.
+
+    Returns
+    -------
+    pyppeteer.browser.Browser
+        The fresh browser, or the old one if a fresh one could not be launched.
+
+    """
+
+    from pyppeteer import launch
+
+    try:
+        fresh_browser = await launch(headless=True)
+    except Exception as e:
+        logging.info(e)
+        return browser
+
+    # Closing a stuck browser can hang as well, it is bounded so the fresh browser goes back to work
+    try:
+        await asyncio.wait_for(browser.close(), timeout=10)
+    except Exception as e:
+        logging.info(e)
+
+    return fresh_browser
+
+async def close_browsers(browsers):
+    """Closes the browsers launched by launch_browsers.
+
+    Parameters
+    ----------
+    browsers : asyncio.Queue
+        The idle browsers.
+
+    """
+
+    while not browsers.empty():
+        await browsers.get_nowait().close()
+
+async def extract_traces(browsers, session, url, archive_id, url_id, trace_out_path, timeout_duration):
     """Fetches url from input CSV and extract trace file
     
     Parameters
     ----------
+    browsers : asyncio.Queue
+        The idle browsers.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the urls.
     url : str
         The url to create a trace file.
     archive_id : str
@@ -107,48 +306,64 @@ def extract_traces(url, archive_id, url_id, trace_out_path, timeout_duration):
     timeout_duration : str
         Duration before timeout when going to each website.
 
+    Returns
+    -------
+    tuple
+        The site status, site message and extraction message of the url.
+
     """
 
-    site_status, site_message = check_site_availability(url)
+    from pyppeteer import errors
+
+    logging.info("url #{0} {1}".format(url_id, url))
 
-    if site_status == "FAIL":
-        return site_status, site_message, "Extraction unsuccessful"
-    elif site_status == "REDIRECT":
-        return site_status, site_message, "Extraction unsuccessful"
+    browser = await browsers.get()
 
     try:
-        #loop = asyncio.new_event_loop()
-        #asyncio.set_event_loop(loop)
-        #asyncio.ensure_future(puppeteer_extract_trace(url, archive_id, url_id, trace_out_path, timeout_duration, loop))
-        #loop.run_forever()
+        # The navigation has its own timeout, this one also bounds a hung trace or browser
+        site_status, site_message = await asyncio.wait_for(
+                puppeteer_extract_trace(browser, url, archive_id, url_id, trace_out_path, timeout_duration),
+                timeout=int(timeout_duration) + 10)
 
-        asyncio.get_event_loop().run_until_complete(
-                puppeteer_extract_trace(url, archive_id, url_id, trace_out_path, timeout_duration))
+        if site_status != "LIVE":
+            return site_status, site_message, "Extraction unsuccessful"
 
-        print("Extraction successful")
+        logging.info("Extraction successful")
         return site_status, site_message, "Extraction successful"
     except errors.TimeoutError as e:
-        print(e)
         logging.info(e)
-        return site_status, site_message, e
+        extraction_message = e
+    except asyncio.TimeoutError:
+        extraction_message = "Extraction timed out after {} seconds".format(int(timeout_duration) + 10)
+        logging.info(extraction_message)
+
+        # wait_for does not wait for the cancelled extraction to clean up, so the browser may still
+        # be tracing and is replaced before the next url gets it
+        browser = await replace_browser(browser)
     except errors.NetworkError as e:
-        print(e)
         logging.info(e)
-        return site_status, site_message, e
+        extraction_message = e
     except errors.PageError as e:
-        print(e)
         logging.info(e)
-        return site_status, site_message, e
+        extraction_message = e
     except Exception as e:
-        print(e)
         logging.info(e)  
-        return site_status, site_message, e
+        extraction_message = e
+    finally:
+        browsers.put_nowait(browser)
+
+    # The site never answered the browser, check it directly for the reason
+    site_status, site_message = await check_site_availability(session, url, timeout_duration)
+
+    return site_status, site_message, extraction_message
 
-async def puppeteer_extract_trace(url, archive_id, url_id, trace_out_path, timeout_duration):
+async def puppeteer_extract_trace(browser, url, archive_id, url_id, trace_out_path, timeout_duration):
     """Create trace file using the pyppeteer package.
     
     Parameters
     ----------
+    browser : pyppeteer.browser.Browser
+        The browser to open the url in, only the page is closed afterwards.
     url : str
         The url to create a trace file.
     archive_id : str
@@ -160,6 +375,13 @@ async def puppeteer_extract_trace(url, archive_id, url_id, trace_out_path, timeo
     timeout_duration : str
         Duration before timeout when going to each website.
 
+    Returns
+    -------
+    site_status : str
+        LIVE if the site is up and running, REDIRECT if it was a redirect, FAIL otherwise.
+    site_message : str
+        The reason for the site status.
+
     References
     ----------
     .. [1] https://pypi.org/project/pyppeteer/
@@ -168,83 +390,111 @@ async def puppeteer_extract_trace(url, archive_id, url_id, trace_out_path, timeo
 
     """
 
-    browser = await launch(headless=True)#, loop=loop)
     page = await browser.newPage()
     
-    trace_path = '{}trace.json'.format(trace_out_path)
+    # Each url has its own trace file since several pages are traced at the same time
+    trace_path = '{0}{1}.{2}.json'.format(trace_out_path, archive_id, url_id)
 
     # Begins tracing and waits until all content loaded before stopping trace
     try:
         await page.setViewport({'height': 768, 'width': 1024})
         await page.tracing.start({'path': trace_path})
-        await page.goto(url, {'waitUntil': ['domcontentloaded'], \
-                              'timeout': int(timeout_duration) * 1000})
-        await page.tracing.stop()
-        
-        os.rename(trace_path, '{0}{1}.{2}.json'.format(trace_out_path, archive_id, url_id))
 
-    except Exception as e:
+        try:
+            response = await page.goto(url, {'waitUntil': ['domcontentloaded'], \
+                                             'timeout': int(timeout_duration) * 1000})
+        except:
+            # The browser is reused, stop the trace so it can trace the next url and
+            # only keep the trace files of successful extractions, also when the
+            # extraction is cancelled for taking too long
+            try:
+                await page.tracing.stop()
+                os.remove(trace_path)
+            except Exception:
+                pass
+            raise
+
+        await page.tracing.stop()
+    finally:
         try:
             await page.close()
-            await browser.close()
-            #await loop.stop()
         except:
-            await browser.close()
-            #await loop.stop()
-        raise e
+            pass
 
-    try:
-        await page.close()
-        await browser.close()
-        #await loop.stop()
-    except:
-        await browser.close()
-        #await loop.stop()
-
-def check_site_availability(url):
+    # The site status comes from the navigation itself, only the traces of sites
+    # that are up are kept
+    if response is not None and response.status >= 400:
+        os.remove(trace_path)
+        error_message = 'HTTPError: {}'.format(response.status)
+        logging.info(error_message)
+        return "FAIL", error_message
+
+    # Check if request was a redirect
+    if response is not None and response.request.redirectChain:
+        os.remove(trace_path)
+        logging.info("Redirected to {}".format(response.url))
+        return "REDIRECT", "Redirected to {}".format(response.url)
+
+    # Successful connection: code 200
+    logging.info("Successful connection to {}".format(url))
+    return "LIVE", "Successful connection to {}".format(url)
+
+async def check_site_availability(session, url, timeout_duration):
     """Run a request to see if the given url is available.
 
+    Only used when the browser could not reach the url, only the headers are requested.
+
     Parameters
     ----------
+    session : aiohttp.ClientSession
+        The session used to check the availability of the urls.
     url : str
         The url to check.
+    timeout_duration : str
+        Duration before timeout when checking the website.
 
     Returns
     -------
-    200 if the site is up and running
-    302 if it was a redirect
-    -7  for URL errors
-    ?   for HTTP errors
-    -8  for other error
+    site_status : str
+        LIVE if the site is up and running, REDIRECT if it was a redirect, FAIL otherwise.
+    site_message : str
+        The reason for the site status.
 
     """
 
+    timeout = aiohttp.ClientTimeout(total=int(timeout_duration))
+
     try:
-        conn = urllib.request.urlopen(url)
-    except urllib.error.URLError as e:
-        error_message = 'URLError: {}'.format(e.reason)
-        print(error_message)
+        for method in ("HEAD", "GET"):
+            async with session.request(method, url, timeout=timeout) as response:
+                # Some servers refuse HEAD requests, ask for the page instead
+                if method == "HEAD" and response.status in (405, 501):
+                    continue
+                break
+    except asyncio.TimeoutError:
+        error_message = 'URLError: timed out'
         logging.info(error_message)
         return "FAIL", error_message
-    except urllib.error.HTTPError as e:
-        error_message = 'HTTPError: {}'.format(e.code)
-        print(error_message)
+    except aiohttp.ClientError as e:
+        error_message = 'URLError: {}'.format(e)
         logging.info(error_message)
         return "FAIL", error_message
     except Exception as e:
         error_message = 'Other: {}'.format(e)
-        print(error_message)
+        logging.info(error_message)
+        return "FAIL", error_message
+
+    if response.status >= 400:
+        error_message = 'HTTPError: {}'.format(response.status)
         logging.info(error_message)
         return "FAIL", error_message
 
     # Check if request was a redirect
-    if conn.geturl() != url:
-        print("Redirected to {}".format(conn.geturl()))
-        logging.info("Redirected to {}".format(conn.geturl()))
-        return "REDIRECT", "Redirected to {}".format(conn.geturl())
+    if response.history:
+        logging.info("Redirected to {}".format(response.url))
+        return "REDIRECT", "Redirected to {}".format(response.url)
 
     # Successful connection: code 200
-    print("Successfully connected to {}".format(url))
     logging.info("Successful connection to {}".format(url))
     return "LIVE", "Successful connection to {}".format(url)                
 
@@ -267,6 +517,8 @@ def parse_args():
         Duration before timeout when attempting to connect to a website.
     make_csv : nool
         Whether or not to output a CSV when use_db is True.
+    verbose : bool
+        Whether or not to also print the log messages to stdout.
 
     """
 
@@ -277,6 +529,7 @@ def parse_args():
     parser.add_argument("--csv", type=str, help="Input CSV file with current urls")
     parser.add_argument("--tracesout", type=str, help="(Optional)Specify directory to output the trace files, default creates new folder named 'ctraces' in current directory")
     parser.add_argument("--timeout", type=str, help="(Optional) Specify duration before timeout for each site, in seconds, default 30 seconds")
+    parser.add_argument("--verbose", action='store_true', help="(Optional) Include to print the log messages to stdout, default only writes the log file")
 
     args = parser.parse_args()
 
@@ -324,7 +577,7 @@ def parse_args():
     else:
         timeout_duration = args.timeout
 
-    return args.csv, args.out, path, timeout_duration, use_csv, use_db, make_csv
+    return args.csv, args.out, path, timeout_duration, use_csv, use_db, make_csv, args.verbose
 
 def connect_sql(path):
     """Connect the database file, and creates the necessary tables.
@@ -340,7 +593,14 @@ def connect_sql(path):
 
     connection = sqlite3.connect(path)
     cursor = connection.cursor()
-    
+
+    # Write ahead logging only syncs at checkpoints, the cache and temporary tables stay in memory
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.execute("PRAGMA cache_size=-65536;")          # 64 MiB
+    cursor.execute("PRAGMA mmap_size=268435456;")        # 256 MiB
+
     cursor.execute("SELECT count(name) FROM sqlite_master WHERE type='table' AND name='current_urls'")
 
     if cursor.fetchone()[0] == 1:
@@ -349,12 +609,8 @@ def connect_sql(path):
                        "FOREIGN KEY (archiveID) REFERENCES collection_name(archiveID));")
         connection.commit()
 
-        cursor.execute("SELECT DISTINCT archiveID from current_trace_status;")
-        connection.commit()
-        results = cursor.fetchall()
-
-        for row in results:
-            cursor.execute("DELETE FROM current_trace_status WHERE archiveID = {};".format(row[0]))
+        # Clear the statuses of previous runs, SQLite truncates the table when there is no WHERE clause
+        cursor.execute("DELETE FROM current_trace_status;")
         connection.commit()
 
     else:
@@ -362,9 +618,22 @@ def connect_sql(path):
         connection.close()
         exit()
 
-def set_up_logging():
+def set_up_logging(verbose):
     """Setting up logging format.
 
+    The urls only put their messages in a queue, the files and stdout are written by
+    the listener's thread.
+
+    Parameters
+    ----------
+    verbose : bool
+        Whether or not to also print the log messages to stdout.
+
+    Returns
+    -------
+    logging.handlers.QueueListener
+        The listener writing the log messages, to be stopped at the end of the run.
+
     Notes
     -----
     logging parameters:
@@ -376,19 +645,74 @@ def set_up_logging():
 
     """
 
-    logging.basicConfig(filename="current_traces_log.txt", filemode='a',
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        datefmt='%d-%b-%y %H:%M:%S %p', level=logging.INFO)
+    file_handler = logging.FileHandler("current_traces_log.txt", mode='a')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                                                datefmt='%d-%b-%y %H:%M:%S %p'))
+    handlers = [file_handler]
+
+    if verbose:
+        handlers.append(logging.StreamHandler(sys.stdout))
+
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+
+    # The message is only formatted by the listener's handlers
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    logging.basicConfig(handlers=[queue_handler], level=logging.INFO)
+
+    return listener
+
+async def main_async(csv_in_name, csv_out_name, trace_out_path, timeout_duration, use_csv, use_db, make_csv):
+    """Launches the browsers once and extracts the trace files of every url.
+
+    Parameters
+    ----------
+    csv_in_name : str
+        The CSV file containing current urls.
+    csv_out_name : str
+        The CSV file to store the extraction status of current urls.
+    trace_out_path : str
+        The directory to store the trace files.
+    timeout_duration : str
+        Duration before timeout when going to each website.
+    use_csv : bool
+        Whether or not the input is a CSV file.
+    use_db : bool
+        Whether or not the input is a DB file.
+    make_csv : bool
+        Whether or not to output a CSV when use_db is True.
+
+    """
+
+    browsers = await launch_browsers()
+
+    # One session checks every url, keeping connections to the same hosts open
+    connector = aiohttp.TCPConnector(limit=MAX_AVAILABILITY_CHECKS)
+
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            if use_csv:
+                await create_with_csv(browsers, session, csv_in_name, csv_out_name, trace_out_path, timeout_duration)
+            if use_db:
+                await create_with_db(browsers, session, csv_out_name, trace_out_path, timeout_duration, make_csv)
+    finally:
+        await close_browsers(browsers)
 
 def main():
-    csv_in_name, csv_out_name, trace_out_path, timeout_duration, use_csv, use_db, make_csv = parse_args()
-    set_up_logging()
+    csv_in_name, csv_out_name, trace_out_path, timeout_duration, use_csv, use_db, make_csv, verbose = parse_args()
+    listener = set_up_logging(verbose)
 
     print("Extracting trace files...")
-    if use_csv:
-        create_with_csv(csv_in_name, csv_out_name, trace_out_path, timeout_duration)
-    if use_db:
-        create_with_db(csv_out_name, trace_out_path, timeout_duration, make_csv)
+
+    # Every url is extracted in this one run of the event loop
+    try:
+        asyncio.get_event_loop().run_until_complete(
+                main_async(csv_in_name, csv_out_name, trace_out_path, timeout_duration, use_csv, use_db, make_csv))
+    finally:
+        listener.stop()         # writes the remaining log messages
 
 main()
 
@@ -2,16 +2,31 @@ import argparse
 import csv
 import asyncio
 import sqlite3
-import urllib.request
-import urllib.error
 import logging
+import logging.handlers
+import queue
+import threading
 import time
 import os
 import tracemalloc
 import linecache
 from datetime import datetime, timedelta
+import aiohttp
 from pyppeteer import launch
-from pyppeteer import errors
+
+# Number of network requests inserted into the database at a time
+INSERT_BATCH_SIZE = 1000
+
+# Number of file writes queued for the file thread before the event loop waits on it
+WRITE_QUEUE_SIZE = 10000
+
+# Size of the log file before it is rolled over, and the number of rolled over files kept
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Names of the CSV files containing the network requests of each archive/current URL
+ARCHIVE_REQUESTS_FILE_NAME = '{0}{1}.{2}.{3}.csv'.format
+CURRENT_REQUESTS_FILE_NAME = '{0}{1}.{2}.csv'.format
 
 # Code taken directly from reference
 def display_top(snapshot, key_type='lineno', limit=10):
@@ -63,9 +78,79 @@ def display_top(snapshot, key_type='lineno', limit=10):
     
     print("Total allocated size: %.1f KiB" % (total / 1024))
 
+class FileThread:
+    """
+    Runs the file writes of the writers in order in a background thread, so the event loop
+    extracting the network requests is not held up by disk I/O.
+
+    ...
+
+    Attributes
+    ----------
+    tasks : queue.Queue
+        The file writes waiting to run, None stops the thread.
+    thread : threading.Thread
+        The thread running the file writes.
+    error : Exception
+        The first file write that failed, None if every write succeeded.
+
+    Methods
+    -------
+    submit(function, *args)
+        Queues a file write.
+    run()
+        Runs the queued file writes until the thread is stopped.
+    stop()
+        Runs the remaining file writes, stops the thread and raises the first failed write.
+
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        """Queues a file write, waiting for room if the thread is behind.
+
+        Parameters
+        ----------
+        function : function
+            The file write to run.
+        args : tuple
+            The arguments of the file write.
+
+        """
+
+        self.tasks.put((function, args))
+
+    def run(self):
+        """Runs the queued file writes until the thread is stopped."""
+
+        for function, args in iter(self.tasks.get, None):
+            try:
+                function(*args)
+            except Exception as e:
+                print(e)
+                logging.info("%s", e)
+
+                # Kept to be raised once the thread is stopped, the other files are still written
+                if self.error is None:
+                    self.error = e
+
+    def stop(self):
+        """Runs the remaining file writes, stops the thread and raises the first failed write."""
+
+        self.tasks.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
 class Writer:
     """
-    Base writer class which handles writing CSV files
+    Base writer class which handles writing CSV files, the files are written by a FileThread.
 
     ...
 
@@ -73,17 +158,29 @@ class Writer:
     ----------
     file_name : str
         The CSV file name where info is output to.
-    rows : list 
-        Contains the elements to be inputted to the CSV file.
     use_archive : bool
         Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+    file_thread : FileThread
+        The thread writing the CSV file.
+    csv_file_out : file
+        The open CSV file, None until the first row is written.
+    csv_writer : csv.writer
+        Writes the rows to the open CSV file.
 
     Methods
     -------
-    reset()
-        Clears the elements inside rows and changes the file_nam preparing for the next CSV file.
+    initialize()
+        Creates the CSV file with the header info.
+    write(row)
+        Writes a row to the CSV file, creating it first if needed.
     finalize()
-        Writes the elements inside rows to the CSV file.
+        Closes the CSV file.
+    open()
+        Creates the CSV file and writes the header to it, in the file thread.
+    write_row(row)
+        Writes a row to the CSV file, in the file thread.
+    close()
+        Closes the CSV file, in the file thread.
 
     References
     ----------
@@ -91,45 +188,80 @@ class Writer:
 
     """
 
-    def __init__(self, file_name, use_archive):
+    def __init__(self, file_name, use_archive, file_thread):
         """
         Parameters
         ----------
         file_name : str
             The CSV file name where info is output to.
-        rows : list
-            Contains the elements to be inputted to the CSV file.
         use_archive : bool
             Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+        file_thread : FileThread
+            The thread writing the CSV file.
 
         """
 
         self.file_name = file_name
-        self.rows = []
         self.use_archive = use_archive
+        self.file_thread = file_thread
+        self.csv_file_out = None
+        self.csv_writer = None
+
+    def initialize(self):
+        """Creates the CSV file with the header info."""
+
+        self.file_thread.submit(self.open)
+
+    def write(self, row):
+        """Writes a row to the CSV file, the file is only created once it has a row.
 
-    def reset(self, file_name):
-        """Clears the array and changes the file_name preparing for the next CSV file.
-        
         Parameters
         ----------
-        file_name : str
-            The CSV file name where info is output to.
+        row : tuple
+            The CSV element.
 
         """
 
-        self.file_name = file_name
-        self.rows.clear()
+        self.file_thread.submit(self.write_row, row)
 
     def finalize(self):
-        """Writes the elements inside rows to the CSV file."""
+        """Closes the CSV file."""
+
+        self.file_thread.submit(self.close)
 
-        with open(self.file_name, 'w+') as csv_file_out:
-            csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-            csv_writer.writerows(self.rows)
+    def open(self):
+        """Creates the CSV file and writes the header to it, in the file thread."""
 
-        # Close file
-        csv_file_out.close()
+        self.csv_file_out = open(self.file_name, 'w', newline='', buffering=1048576)   # 1 MiB buffer
+        self.csv_writer = csv.writer(self.csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+
+        if self.use_archive:
+            self.csv_writer.writerow(self.archive_header)
+        else:
+            self.csv_writer.writerow(self.current_header)
+
+    def write_row(self, row):
+        """Writes a row to the CSV file, in the file thread.
+
+        Parameters
+        ----------
+        row : tuple
+            The CSV element.
+
+        """
+
+        if self.csv_file_out is None:
+            self.open()
+
+        self.csv_writer.writerow(row)
+
+    def close(self):
+        """Closes the CSV file, in the file thread."""
+
+        if self.csv_file_out is not None:
+            self.csv_file_out.close()
+            self.csv_file_out = None
+            self.csv_writer = None
 
 class CSVWriter(Writer):
     """
@@ -138,25 +270,109 @@ class CSVWriter(Writer):
 
     ...
 
+    Attributes
+    ----------
+    archive_header : tuple
+        The header of the CSV file for archive URLs.
+    current_header : tuple
+        The header of the CSV file for current URLs.
+
     Methods
     -------
-    initialize()
-        Appends the header info to rows.
+    write_row(row)
+        Writes a pre-quoted row to the CSV file, in the file thread.
     writerow(archive_id, url_id, url, status_code)
-        Appends CSV element to rows.
+        Writes CSV element to the CSV file.
 
     """
 
-    def initialize(self):
-        """Appends the header info to rows."""
+    archive_header = ("archive_id", "url_id", "date", "url", "resource_type", "status_code")
+    current_header = ("archive_id", "url_id", "url", "resource_type", "status_code")
+
+    def write_row(self, row):
+        """Writes a row to the CSV file, in the file thread.
+
+        Every response is written here, so the fields are quoted like csv.QUOTE_ALL and the line
+        is written directly instead of going through csv.writer.
+
+        Parameters
+        ----------
+        row : tuple
+            The CSV element.
+
+        """
+
+        if self.csv_file_out is None:
+            self.open()
+
+        self.csv_file_out.write('"' + '","'.join([str(field).replace('"', '""') for field in row]) + '"\r\n')
+
+    def writerow(self, archive_id, url_id, url, resource_type, status_code, date=None):
+        """Writes CSV element to the CSV file.
+
+        Parameters
+        ----------
+        archive_id : str
+            The archive ID.
+        url_id : str
+            The URL ID.
+        url : str
+            The network request URL.
+        resource_type : str
+            The resouce type of the network request.
+        status_code : str
+            The status code of the network request.
+        date : str
+            The date of the archive URL. Default is None if current URL.
 
+        """
+        
         if self.use_archive:
-            self.rows.append(["archive_id", "url_id", "date", "url", "resource_type", "status_code"])
+            self.write((archive_id, url_id, date, url, resource_type, status_code))
         else:
-            self.rows.append(["archive_id", "url_id", "url", "resource_type", "status_code"])
+            self.write((archive_id, url_id, url, resource_type, status_code))
+
+class DBWriter(CSVWriter):
+    """
+    Inherits from CSVWriter class, this class inserts the network requests into the database
+    in batches as they are received, and also writes them to the CSV file if a file name is given.
+
+    ...
+
+    Attributes
+    ----------
+    requests : list
+        The network requests not yet inserted into the database.
+
+    Methods
+    -------
+    writerow(archive_id, url_id, url, status_code)
+        Queues the network request for the database and writes CSV element to the CSV file.
+    flush()
+        Inserts the queued network requests into the database.
+    finalize()
+        Inserts the remaining network requests and closes the CSV file.
+
+    """
+
+    def __init__(self, file_name, use_archive, file_thread):
+        """
+        Parameters
+        ----------
+        file_name : str
+            The CSV file name where info is output to, None to only insert into the database.
+        use_archive : bool
+            Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+        file_thread : FileThread
+            The thread writing the CSV file.
+
+        """
+
+        super().__init__(file_name, use_archive, file_thread)
+        self.requests = []
 
     def writerow(self, archive_id, url_id, url, resource_type, status_code, date=None):
-        """Appends CSV element to rows.
+        """Queues the network request for the database and writes CSV element to the CSV file.
 
         Parameters
         ----------
@@ -174,11 +390,35 @@ class CSVWriter(Writer):
             The date of the archive URL. Default is None if current URL.
 
         """
-        
+
+        if self.use_archive:
+            self.requests.append((archive_id, url_id, date, url, resource_type, status_code))
+        else:
+            self.requests.append((archive_id, url_id, url, resource_type, status_code))
+
+        if len(self.requests) >= INSERT_BATCH_SIZE:
+            self.flush()
+
+        if self.file_name is not None:
+            super().writerow(archive_id, url_id, url, resource_type, status_code, date)
+
+    def flush(self):
+        """Inserts the queued network requests into the database."""
+
         if self.use_archive:
-            self.rows.append([archive_id, url_id, date, url, resource_type, status_code])
+            cursor.executemany("INSERT INTO archive_network_requests VALUES (?, ?, ?, ?, ?, ?);",
+                               self.requests)
         else:
-            self.rows.append([archive_id, url_id, url, resource_type, status_code])
+            cursor.executemany("INSERT INTO current_network_requests VALUES (?, ?, ?, ?, ?);",
+                               self.requests)
+
+        self.requests.clear()
+
+    def finalize(self):
+        """Inserts the remaining network requests and closes the CSV file."""
+
+        self.flush()
+        super().finalize()
 
 class IndexWriter(Writer):
     """
@@ -187,27 +427,27 @@ class IndexWriter(Writer):
 
     ...
 
+    Attributes
+    ----------
+    archive_header : tuple
+        The header of the CSV file for archive URLs.
+    current_header : tuple
+        The header of the CSV file for current URLs.
+
     Methods
     -------
-    initialize()
-        Appends the header info to rows.
     writerow()
-        Appends CSV element to rows.
+        Writes CSV element to the CSV file.
 
     """
 
-    def initialize(self):
-        """Appends the header info to rows."""
-
-        if self.use_archive:
-            self.rows.append(["archive_id", "url_id", "date", "archive_url", \
-                              "site_status", "site_message", "extraction_message"])
-        else:
-            self.rows.append(["archive_id", "url_id", "current_url", \
-                              "site_status", "site_message", "extraction_message"])
+    archive_header = ("archive_id", "url_id", "date", "archive_url", \
+                      "site_status", "site_message", "extraction_message")
+    current_header = ("archive_id", "url_id", "current_url", \
+                      "site_status", "site_message", "extraction_message")
     
     def writerow(self, archive_id, url_id, url, site_status, site_message, extraction_message, date=None):
-        """Appends CSV element to rows.
+        """Writes CSV element to the CSV file.
 
         Parameters
         ----------
@@ -230,109 +470,262 @@ class IndexWriter(Writer):
         """
     
         if self.use_archive:
-            self.rows.append([archive_id, url_id, date, url, site_status, \
-                    site_message, extraction_message])
+            self.write((archive_id, url_id, date, url, site_status, \
+                    site_message, extraction_message))
         else:
-            self.rows.append([archive_id, url_id, url, site_status, site_message, extraction_message])
+            self.write((archive_id, url_id, url, site_status, site_message, extraction_message))
+
+class PagePool:
+    """
+    Keeps pages of the shared browser open so every URL does not open and close a page of its own.
+
+    ...
+
+    Attributes
+    ----------
+    browser : Browser
+        The Chromium browser shared by every URL.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    pages : asyncio.Queue
+        The pages not being used by a URL.
+
+    Methods
+    -------
+    open(size)
+        Opens the pages of the pool.
+    new_page()
+        Opens a page on the browser.
+    get()
+        Takes a page from the pool, waiting until one is released if needed.
+    release(page)
+        Clears the page and puts it, or a new page replacing it, back in the pool.
+
+    """
+
+    def __init__(self, browser, block):
+        """
+        Parameters
+        ----------
+        browser : Browser
+            The Chromium browser shared by every URL.
+        block : frozenset
+            The resource types whose requests are aborted instead of fetched.
+
+        """
+
+        self.browser = browser
+        self.block = block
+        self.pages = asyncio.Queue()
+
+    async def open(self, size):
+        """Opens the pages of the pool.
+
+        Parameters
+        ----------
+        size : int
+            The number of pages, no more URLs than this are extracted at the same time.
+
+        """
+
+        for _ in range(size):
+            self.pages.put_nowait(await self.new_page())
+
+    async def new_page(self):
+        """Opens a page on the browser.
+
+        Returns
+        -------
+        Page
+            The new page, intercepting requests if some are blocked.
 
-def create_with_csv(csv_in_name, csv_out_path, csv_index_name, timeout_duration, use_archive):
+        """
+
+        page = await self.browser.newPage()
+
+        # Requests are only intercepted when some are blocked, otherwise Chromium fetches the
+        # subresources without waiting on python
+        if self.block:
+            await page.setRequestInterception(True)
+
+        return page
+
+    async def get(self):
+        """Takes a page from the pool, waiting until one is released if needed.
+
+        Returns
+        -------
+        Page
+            A page showing about:blank.
+
+        """
+
+        return await self.pages.get()
+
+    async def release(self, page):
+        """Clears the page and puts it, or a new page replacing it, back in the pool.
+
+        The pool never loses a page, otherwise the remaining URLs would wait forever in get().
+
+        Parameters
+        ----------
+        page : Page
+            The page taken from the pool.
+
+        """
+
+        try:
+            # Stops what is left of the last URL loading before the page is used for the next one
+            await page.goto('about:blank')
+        except Exception:
+            # The page is replaced if it can no longer navigate
+            try:
+                fresh_page = await self.new_page()
+            except Exception as e:
+                # The browser is gone, the old page goes back so the next URLs fail instead of waiting
+                logging.info("%s", e)
+                fresh_page = page
+
+            if fresh_page is not page:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+            page = fresh_page
+
+        self.pages.put_nowait(page)
+
+async def create_with_csv(pages, session, file_thread, csv_in_name, csv_out_path, csv_index_name, timeout_duration,
+                          use_archive, concurrency, block, settle):
     """Extracts network requests using the input CSV with seed URLs.
     
     Parameters
     ----------
+    pages : PagePool
+        The open pages of the browser shared by every URL.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
+    file_thread : FileThread
+        The thread writing the CSV files.
     csv_in_name : str
         The CSV file with the seed urls.
     csv_out_path : str
         The directory to store the CSV files containing the network requests.
     csv_index_name : str
         The CSV file to write the extraction status.
-    timeout_duration : str
+    timeout_duration : int
         Duration before timeout when going to each website.
     use_archive : bool
         Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+    concurrency : int
+        The number of URLs extracted at the same time.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
 
     """
 
     with open(csv_in_name, 'r') as csv_file_in:
         csv_reader = csv.reader(csv_file_in)
-            
-        index_writer = IndexWriter(csv_index_name, use_archive)
-        csv_writer = CSVWriter(csv_out_path, use_archive)
-
-        # Append header info to CSV files
-        index_writer.initialize()
 
         # Skip the header of the CSV
         next(csv_reader)
 
-        for row in csv_reader:
-            archive_id = row[0]
-            url_id = row[1]
+        rows = list(csv_reader)
 
-            if use_archive:
-                date = row[2]
-                url = row[3]
-                csv_out_name = '{0}{1}.{2}.{3}.csv'.format(csv_out_path, archive_id, url_id, date)
-            else:
-                date = None
-                url = row[2]
-                csv_out_name = '{0}{1}.{2}.csv'.format(csv_out_path, archive_id, url_id)
+    index_writer = IndexWriter(csv_index_name, use_archive, file_thread)
 
-            # Empty rows and change csv name
-            csv_writer.reset(csv_out_name)
-            csv_writer.initialize()
+    # Write header info to CSV file
+    index_writer.initialize()
 
-            print("url #{0} {1}".format(url_id, url))
-            logging.info("url #{0} {1}".format(url_id, url))
+    seeds = []
+    extractions = []
+    semaphore = asyncio.Semaphore(concurrency)
 
-            site_status, site_message, extraction_message = extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date)
+    for row in rows:
+        archive_id = row[0]
+        url_id = row[1]
 
-            # Append index element to rows (array in IndexWriter class)
-            index_writer.writerow(archive_id, url_id, url, site_status, \
-                    site_message, extraction_message, date)
+        if use_archive:
+            date = row[2]
+            url = row[3]
+            csv_out_name = ARCHIVE_REQUESTS_FILE_NAME(csv_out_path, archive_id, url_id, date)
+        else:
+            date = None
+            url = row[2]
+            csv_out_name = CURRENT_REQUESTS_FILE_NAME(csv_out_path, archive_id, url_id)
 
-            # Checks if elements exist other than header. If True, writes to file. Otherwise pass.
-            if (len(csv_writer.rows) != 1):
-                csv_writer.finalize()
-    
-        # Write elements to CSV file
-        index_writer.finalize()
+        seeds.append((archive_id, url_id, url, date))
+
+        # Each URL has a CSVWriter of its own since the URLs are extracted concurrently
+        csv_writer = CSVWriter(csv_out_name, use_archive, file_thread)
+        extractions.append(extract_to_csv(semaphore, pages, session, csv_writer, url, archive_id, url_id,
+                                          timeout_duration, date, block, settle))
 
-def create_with_db(csv_out_path, csv_index_name, timeout_duration, make_csv, use_archive):
+    # The URLs are extracted concurrently on pages of the same browser, results come back in input order
+    statuses = await asyncio.gather(*extractions)
+
+    for (archive_id, url_id, url, date), (site_status, site_message, extraction_message) in zip(seeds, statuses):
+        # Write index element to the CSV file
+        index_writer.writerow(archive_id, url_id, url, site_status, \
+                site_message, extraction_message, date)
+
+    # Close the CSV file
+    index_writer.finalize()
+
+async def create_with_db(pages, session, file_thread, csv_out_path, csv_index_name, timeout_duration, make_csv,
+                         use_archive, concurrency, block, settle):
     """Extracts network requests using the input database file with seed URLs.
 
     Parameters
     ----------
+    pages : PagePool
+        The open pages of the browser shared by every URL.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
+    file_thread : FileThread
+        The thread writing the CSV files.
     csv_out_path : str
         The directory to store the CSV files containing the network requests..
     csv_index_name : str
         The CSV file to write the extraction status.
-    timeout_duration : str
+    timeout_duration : int
         Duration before timeout when going to each website.
     make_csv : bool
         Whether or not to also output a CSV file.
     use_archive : bool
         Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+    concurrency : int
+        The number of URLs extracted at the same time.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
 
     """
 
     if use_archive:
-        cursor.execute("SELECT * FROM archive_urls;")
+        query = "SELECT archiveID, urlID, date, url FROM archive_urls;"
     else:
-        cursor.execute("SELECT * FROM current_urls;")
-
-    connection.commit()
-    results = cursor.fetchall()
+        query = "SELECT archiveID, urlID, url FROM current_urls;"
 
-    csv_writer = CSVWriter(csv_out_path, use_archive)
-    index_writer = IndexWriter(csv_index_name, use_archive)
+    # The network requests go straight into the database, and to the CSV file if one is made
+    csv_writer = DBWriter(csv_out_path if make_csv else None, use_archive, file_thread)
+    index_writer = IndexWriter(csv_index_name, use_archive, file_thread)
 
     if make_csv:
-        # Append header info to CSV files
+        # Write header info to CSV files
         index_writer.initialize()
         csv_writer.initialize()
 
-    for row in results:
+    seeds = []
+    extractions = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # The seeds are read from a cursor of their own, the network requests are inserted with the global one
+    for row in connection.execute(query):
         archive_id = str(row[0])
         url_id = str(row[1])
 
@@ -343,50 +736,140 @@ def create_with_db(csv_out_path, csv_index_name, timeout_duration, make_csv, use
             date = None
             url = row[2]
 
-        print("url #{0} {1}".format(url_id, url))
-        logging.info("url #{0} {1}".format(url_id, url))
+        seeds.append((archive_id, url_id, url, date))
+
+        # The URLs share the DBWriter, its rows are only written between awaits
+        extractions.append(bounded_extract_requests(semaphore, pages, session, csv_writer, url, archive_id, url_id,
+                                                    timeout_duration, date, block, settle))
+
+    # The URLs are extracted concurrently on pages of the same browser, results come back in input order
+    statuses = await asyncio.gather(*extractions)
 
-        site_status, site_message, extraction_message = extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date)
+    extraction_statuses = []
 
+    for (archive_id, url_id, url, date), (site_status, site_message, extraction_message) in zip(seeds, statuses):
         if make_csv:
             index_writer.writerow(archive_id, url_id, url, site_status, \
                     site_message, extraction_message, date)
 
         if use_archive:
-            cursor.execute('INSERT INTO archive_extraction_status VALUES ({0}, {1}, "{2}", '
-                           '"{3}", "{4}", "{5}", "{6}")'.format(archive_id, url_id, date, url, \
-                                                         site_status, site_message, extraction_message))
+            extraction_statuses.append((archive_id, url_id, date, url, site_status, site_message,
+                                        extraction_message))
         else:
-            cursor.execute('INSERT INTO current_extraction_status VALUES ({0}, {1}, "{2}", '
-                           '"{3}", "{4}", "{5}")'.format(archive_id, url_id, url, \
-                                                  site_status, site_message, extraction_message))
+            extraction_statuses.append((archive_id, url_id, url, site_status, site_message,
+                                        extraction_message))
 
-    if make_csv:
-        csv_writer.finalize()
-        index_writer.finalize()
-
-    # Skips header element in rows
-    csv_elements_no_header = iter(csv_writer.rows)
-    next(csv_elements_no_header, None)
+    if use_archive:
+        cursor.executemany("INSERT INTO archive_extraction_status VALUES (?, ?, ?, ?, ?, ?, ?);",
+                           extraction_statuses)
+    else:
+        cursor.executemany("INSERT INTO current_extraction_status VALUES (?, ?, ?, ?, ?, ?);",
+                           extraction_statuses)
 
-    # Append elements to database
-    for element in csv_elements_no_header:
-        if use_archive:
-            cursor.execute('INSERT INTO archive_network_requests VALUES ({0}, {1}, "{2}", "{3}", "{4}", "{5}")'\
-                           .format(element[0], element[1], element[2], element[3], element[4], element[5]))
-        else:
-            cursor.execute('INSERT INTO current_network_requests VALUES ({0}, {1}, "{2}", "{3}", "{4}")'\
-                           .format(element[0], element[1], element[2], element[3], element[4]))
+    csv_writer.finalize()
+    index_writer.finalize()
 
     # Commit and close database
     connection.commit()
     connection.close()
 
-def extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date):
+async def extract_to_csv(semaphore, pages, session, csv_writer, url, archive_id, url_id, timeout_duration, date,
+                         block, settle):
+    """Extracts the network requests of a URL into a CSV file of its own.
+
+    Parameters
+    ----------
+    semaphore : asyncio.Semaphore
+        Limits the number of URLs extracted at the same time.
+    pages : PagePool
+        The open pages of the browser shared by every URL.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
+    csv_writer : CSVWriter
+        CSVWriter object which handles the creation of the CSV file containing the network requests.
+    url : str
+        The URL to extract network requests.
+    archive_id : str
+        The archive ID.
+    url_id : str
+        The URL ID.
+    timeout_duration : int
+        Duration before timeout when going to each website.
+    date : str
+        The date of the archive URL.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
+
+    Returns
+    -------
+    tuple
+        The site status, site message and extraction message of the URL.
+
+    """
+
+    try:
+        return await bounded_extract_requests(semaphore, pages, session, csv_writer, url, archive_id, url_id,
+                                              timeout_duration, date, block, settle)
+    finally:
+        # The CSV file is only created once a network request is written to it, close it even if extraction failed
+        csv_writer.finalize()
+
+async def bounded_extract_requests(semaphore, pages, session, csv_writer, url, archive_id, url_id, timeout_duration,
+                                   date, block, settle):
+    """Extracts the network requests of a URL once fewer URLs than the concurrency are being extracted.
+
+    Parameters
+    ----------
+    semaphore : asyncio.Semaphore
+        Limits the number of URLs extracted at the same time.
+    pages : PagePool
+        The open pages of the browser shared by every URL.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
+    csv_writer : CSVWriter
+        CSVWriter object which handles the creation of the CSV file containing the network requests.
+    url : str
+        The URL to extract network requests.
+    archive_id : str
+        The archive ID.
+    url_id : str
+        The URL ID.
+    timeout_duration : int
+        Duration before timeout when going to each website.
+    date : str
+        The date of the archive URL.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
+
+    Returns
+    -------
+    tuple
+        The site status, site message and extraction message of the URL.
+
+    """
+
+    async with semaphore:
+        message = "url #{0} {1}".format(url_id, url)
+        print(message)
+        logging.info(message)
+
+        return await extract_requests(pages, session, csv_writer, url, archive_id, url_id, timeout_duration, date,
+                                      block, settle)
+
+async def extract_requests(pages, session, csv_writer, url, archive_id, url_id, timeout_duration, date, block,
+                           settle):
     """Fetches URL from input CSV and extract network requests 
     
     Parameters
     ----------
+    pages : PagePool
+        The open pages of the browser shared by every URL.
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
     csv_writer : CSVWriter
         CSVWriter object which handles the creation of the CSV file containing the network requests.
     url : str
@@ -395,46 +878,48 @@ def extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date
         The archive ID.
     url_id : str
         The URL ID.
-    timeout_duration : str
+    timeout_duration : int
         Duration before timeout when going to each website.
     date : str
         The date of the archive URL.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
 
     """
 
-    site_status, site_message, url = check_site_availability(url)
+    site_status, site_message, url = await check_site_availability(session, url, timeout_duration)
 
     if site_status == "FAIL":
         return site_status, site_message, "Extraction unsuccessful"
 
     try:
-        asyncio.get_event_loop().run_until_complete(
-                puppeteer_extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date))
+        await puppeteer_extract_requests(pages, csv_writer, url, archive_id, url_id, timeout_duration, date, block,
+                                         settle)
 
         print("Extraction successful")
         return site_status, site_message, "Extraction successful"
-    except errors.TimeoutError as e:
-        print(e)
-        logging.info(e)
-        return site_status, site_message, e
-    except errors.NetworkError as e:
-        print(e)
-        logging.info(e)
-        return site_status, site_message, e
-    except errors.PageError as e:
-        print(e)
-        logging.info(e)
-        return site_status, site_message, e
     except Exception as e:
-        print(e)
-        logging.info(e)  
-        return site_status, site_message, e
-
-async def puppeteer_extract_requests(csv_writer, url, archive_id, url_id, timeout_duration, date):
+        # Pyppeteer timeouts, network and page errors all end the extraction of the URL the same way,
+        # only the message is kept so the exception and its traceback are not held on to
+        extraction_message = str(e)
+        print(extraction_message)
+        logging.info(extraction_message)
+        return site_status, site_message, extraction_message
+
+async def puppeteer_extract_requests(pages, csv_writer, url, archive_id, url_id, timeout_duration, date, block,
+                                     settle):
     """Extract network requests using the pyppeteer package.
+
+    By default the page is recorded until the network is idle, which can take up to the timeout
+    on pages that keep polling. With a settle time the page is only recorded for that long once
+    the DOM is loaded, which is faster but misses requests fired later.
     
     Parameters
     ----------
+    pages : PagePool
+        The open pages of the browser shared by every URL.
     csv_writer : CSVWriter
         CSVWriter object which handles the creation of the CSV containing the network requests.
     url : str
@@ -443,10 +928,14 @@ async def puppeteer_extract_requests(csv_writer, url, archive_id, url_id, timeou
         The archive ID.
     url_id : str
         The URL ID.
-    timeout_duration : str
+    timeout_duration : int
         Duration before timeout when going to each website.
     date : str
         The date of the archive URL.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
 
     References
     ----------
@@ -458,74 +947,89 @@ async def puppeteer_extract_requests(csv_writer, url, archive_id, url_id, timeou
 
     """
 
-    # Weird memory issue fix for pyppeteer (setting autoClose=False)
-    browser = await launch(headless=True, dumpio=True, autoClose=False)
+    # Records network responses, the listener is called directly so no task is scheduled per response
+    def handle_response(response):
+        csv_writer.writerow(archive_id, url_id, response.url, \
+                response.request.resourceType, response.status, date)
 
-    # Intercepts network requests
+    # Blocked requests are recorded without a status code since they never get a response
     async def handle_request(request):
-        #print("\tRequest => url: {0}".format(request.url))
-        await request.continue_()
+        resource_type = request.resourceType
 
-    # Intercepts network responses
-    async def handle_response(response, csv_writer, archive_id, url_id, date):
-        csv_writer.writerow(archive_id, url_id, response.url, \
-                response.request.resourceType, response.status, date)
-        #print("Response => url: {0}, status code: {1}, resource type: {2}".format(response.url, \
-                #response.status, response.request.resourceType))
+        if resource_type not in block:
+            await request.continue_()
+            return
+
+        csv_writer.writerow(archive_id, url_id, request.url, resource_type, "blocked", date)
+        await request.abort()
 
-    page = await browser.newPage()
+    request_listener = lambda req: asyncio.ensure_future(handle_request(req))
+
+    page = await pages.get()
 
     try:    
-        await page.setRequestInterception(True)
+        if block:
+            page.on('request', request_listener)
 
-        page.on('request', lambda req: asyncio.ensure_future(handle_request(req)))
-        page.on('response', lambda res: asyncio.ensure_future(handle_response(res, csv_writer, \
-                                                                              archive_id, url_id, date)))
+        page.on('response', handle_response)
         
-        response = await page.goto(url, {'waitUntil': ['networkidle2'], \
-                                         'timeout': int(timeout_duration) * 1000})
+        if settle is None:
+            response = await page.goto(url, {'waitUntil': ['networkidle2'], 'timeout': timeout_duration * 1000})
+        else:
+            # Requests fired after the settle time (ex. analytics beacons, long polling) are not recorded
+            response = await page.goto(url, {'waitUntil': ['domcontentloaded'], 'timeout': timeout_duration * 1000})
+            await asyncio.sleep(settle)
 
-    except Exception as e:
-        try:
-            await page.close()
-            await browser.close()
-        except:
-            await browser.close()
-        raise e
+    finally:
+        # The page goes back to the pool for the next URL, its listeners are only removed once it is cleared
+        await pages.release(page)
 
-    try:
-        await page.close()
-        await browser.close()
-    except:
-        await browser.close()
+        page.remove_listener('response', handle_response)
+
+        if block:
+            page.remove_listener('request', request_listener)
 
-def check_site_availability(url):
+async def check_site_availability(session, url, timeout_duration):
     """Run a request to see if the given URL is available.
 
+    Only the headers are requested, redirects are followed to the final URL.
+
     Parameters
     ----------
+    session : aiohttp.ClientSession
+        The session used to check the availability of the URLs.
     url : str
         The URL to check.
+    timeout_duration : int
+        Duration before timeout when checking the website.
 
     Returns
     -------
-    200 if the site is up and running
-    302 if it was a redirect
-    -7  for URL errors
-    ?   for HTTP errors
-    -8  for other error
+    site_status : str
+        LIVE if the site is up and running, REDIRECT if it was a redirect, FAIL otherwise.
+    site_message : str
+        The reason for the site status.
+    url : str
+        The URL network requests are extracted from, the final URL if it was a redirect.
 
     """
 
+    timeout = aiohttp.ClientTimeout(total=timeout_duration)
+
     try:
-        conn = urllib.request.urlopen(url)
-    except urllib.error.URLError as e:
-        error_message = 'URLError: {}'.format(e.reason)
+        for method in ("HEAD", "GET"):
+            async with session.request(method, url, timeout=timeout) as response:
+                # Some servers refuse HEAD requests, ask for the page instead
+                if method == "HEAD" and response.status in (405, 501):
+                    continue
+                break
+    except asyncio.TimeoutError:
+        error_message = 'URLError: timed out'
         print(error_message)
         logging.info(error_message)
         return "FAIL", error_message, url
-    except urllib.error.HTTPError as e:
-        error_message = 'HTTPError: {}'.format(e.code)
+    except aiohttp.ClientError as e:
+        error_message = 'URLError: {}'.format(e)
         print(error_message)
         logging.info(error_message)
         return "FAIL", error_message, url
@@ -535,16 +1039,24 @@ def check_site_availability(url):
         logging.info(error_message)
         return "FAIL", error_message, url
 
+    if response.status >= 400:
+        error_message = 'HTTPError: {}'.format(response.status)
+        print(error_message)
+        logging.info(error_message)
+        return "FAIL", error_message, url
+
     # Check if request was a redirect
-    if conn.geturl() != url:
-        print("Redirected to {}".format(conn.geturl()))
-        logging.info("Redirected to {}".format(conn.geturl()))
-        return "REDIRECT", "Redirected to {}".format(conn.geturl()), conn.geturl()
+    if response.history:
+        message = "Redirected to {}".format(response.url)
+        print(message)
+        logging.info(message)
+        return "REDIRECT", message, str(response.url)
 
     # Successful connection: code 200
-    print("Successfully connected to {}".format(url))
-    logging.info("Successful connection to {}".format(url))
-    return "LIVE", "Successful connection to {}".format(url), url                
+    message = "Successful connection to {}".format(url)
+    print(message)
+    logging.info(message)
+    return "LIVE", message, url
 
 def parse_args():
     """Parse the arguments passed to in from the commandline
@@ -561,12 +1073,20 @@ def parse_args():
         Whether or not to output as CSV.
     use_db : bool
         Whether or not to output as db.
-    timeout_duration: : str
+    timeout_duration : int
         Duration before timeout when attempting to connect to a website.
     make_csv : bool
         Whether or not to output a CSV when use_db is True.
     use_archive : bool
         Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+    concurrency : int
+        The number of URLs extracted at the same time.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
+    profile : bool
+        Whether or not to trace memory allocations and display the lines allocating the most memory.
 
     """
 
@@ -576,8 +1096,12 @@ def parse_args():
     parser.add_argument("--index", type=str, help="The CSV file to write the extraction status of URLs")
     parser.add_argument("--db", type=str, help="The DB file to store the URLs")
     parser.add_argument("--csv", type=str, help="Input CSV file with current/archive URLs. Interchangable with --db as only one type of input is allowed.")
-    parser.add_argument("--timeout", type=str, help="(Optional) Specify duration before timeout for each site, in seconds, default 30 seconds")
+    parser.add_argument("--timeout", type=int, default=30, help="(Optional) Specify duration before timeout for each site, in seconds, default 30 seconds")
     parser.add_argument("--archive", action="store_true", help="Include to specify input as archive seeds. Do not include if collection is current seeds.")
+    parser.add_argument("--concurrency", type=int, default=5, help="(Optional) Specify the number of URLs extracted at the same time, default 5")
+    parser.add_argument("--block", type=str, default="", help="(Optional) Comma separated resource types to block, ex. image,font,media, default blocks nothing")
+    parser.add_argument("--settle", type=int, help="(Optional) Seconds to keep recording once the DOM is loaded instead of waiting for the network to be idle")
+    parser.add_argument("--profile", action="store_true", help="(Optional) Include to display the lines allocating the most memory at the end, default doesn't profile")
 
     args = parser.parse_args()
 
@@ -610,12 +1134,22 @@ def parse_args():
     else:
         make_csv = False
 
-    if args.timeout is None:
-        timeout_duration = "30"
-    else:
-        timeout_duration = args.timeout
+    # The timeout is parsed once here and used as an int everywhere
+    timeout_duration = args.timeout
+
+    if args.concurrency < 1:
+        print("Concurrency must be at least 1\n")
+        exit()
+
+    if args.settle is not None and args.settle < 0:
+        print("Settle time can not be negative\n")
+        exit()
 
-    return args.csv, args.csvout, args.index, timeout_duration, use_csv, use_db, make_csv, args.archive
+    # Every request is looked up in the blocked resource types while intercepting
+    block = frozenset(resource_type.strip() for resource_type in args.block.split(",") if resource_type.strip())
+
+    return args.csv, args.csvout, args.index, timeout_duration, use_csv, use_db, make_csv, args.archive, \
+            args.concurrency, block, args.settle, args.profile
 
 def connect_sql(path, use_archive):
     """Connect the database file, and creates the necessary tables.
@@ -634,6 +1168,13 @@ def connect_sql(path, use_archive):
     connection = sqlite3.connect(path)
     cursor = connection.cursor()
 
+    # Write ahead logging only syncs at checkpoints, the cache and temporary tables stay in memory
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.execute("PRAGMA cache_size=-65536;")          # 64 MiB
+    cursor.execute("PRAGMA mmap_size=268435456;")        # 256 MiB
+
     if use_archive:
         cursor.execute("SELECT count(name) FROM sqlite_master WHERE type='table' AND name='archive_urls'")
         
@@ -649,17 +1190,11 @@ def connect_sql(path, use_archive):
                            "FOREIGN KEY (archiveID) REFERENCES collection_name(archiveID));")
             connection.commit()
 
-            # Fetch all archive IDs being worked on in archive urls
-            cursor.execute("SELECT DISTINCT archiveID from archive_urls;")
-            connection.commit()
-            results = cursor.fetchall()
-
-            # Remove old results from database corresponding to archive ID in archive urls
-            for row in results:
-                cursor.execute("DELETE FROM archive_extraction_status WHERE archiveID = {};"\
-                        .format(row[0]))
-                cursor.execute("DELETE FROM archive_network_requests WHERE archiveID = {};"\
-                        .format(row[0]))
+            # Remove old results from database corresponding to archive IDs in archive urls
+            cursor.execute("DELETE FROM archive_extraction_status WHERE archiveID IN "
+                           "(SELECT DISTINCT archiveID FROM archive_urls);")
+            cursor.execute("DELETE FROM archive_network_requests WHERE archiveID IN "
+                           "(SELECT DISTINCT archiveID FROM archive_urls);")
             connection.commit()
 
         else:
@@ -681,17 +1216,11 @@ def connect_sql(path, use_archive):
                            "FOREIGN KEY (archiveID) REFERENCES collection_name(archiveID));")
             connection.commit()
 
-            # Fetch all archive IDs being worked on in current urls
-            cursor.execute("SELECT DISTINCT archiveID from current_urls;")
-            connection.commit()
-            results = cursor.fetchall()
-
-            # Remove old results from database corresponding to archive ID in current urls
-            for row in results:
-                cursor.execute("DELETE FROM current_extraction_status WHERE archiveID = {};"\
-                        .format(row[0]))
-                cursor.execute("DELETE FROM current_network_requests WHERE archiveID = {};"\
-                        .format(row[0]))
+            # Remove old results from database corresponding to archive IDs in current urls
+            cursor.execute("DELETE FROM current_extraction_status WHERE archiveID IN "
+                           "(SELECT DISTINCT archiveID FROM current_urls);")
+            cursor.execute("DELETE FROM current_network_requests WHERE archiveID IN "
+                           "(SELECT DISTINCT archiveID FROM current_urls);")
             connection.commit()
 
         else:
@@ -706,28 +1235,39 @@ def set_up_logging(use_archive, timeout_duration):
     ----------
     use_archive : bool
         Whether or not the input is archive seeds. True is archive seeds. False is current seeds.
-    timeout_duration : str
+    timeout_duration : int
         Duration before timeout when attempting to connect to a website.
 
     Notes
     -----
     logging parameters:
-        filename: The file to output the logs
-        filemode: a as in append
-        format:   Format of the message
-        datefmt:  Format of the date in the message, month-day-year hour:minute:second AM/PM
-        level:    Minimum message level accepted
+        filename:    The file to output the logs, appended to
+        maxBytes:    Size of the file before it is rolled over to a backup
+        backupCount: Number of backups kept, the oldest is deleted
+        format:      Format of the message
+        datefmt:     Format of the date in the message, month-day-year hour:minute:second AM/PM
+        level:       Minimum message level accepted
 
     """
 
+    root_logger = logging.getLogger()
+
+    # Logging is only set up once
+    if root_logger.handlers:
+        return
+
     if use_archive:
-        logging.basicConfig(filename="archive_extraction_log_{}.txt".format(timeout_duration),
-                            filemode='a', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                            datefmt='%d-%b-%y %H:%M:%S %p', level=logging.INFO)
+        log_name = "archive_extraction_log_{}.txt".format(timeout_duration)
     else:
-        logging.basicConfig(filename="current_extraction_log_{}.txt".format(timeout_duration),
-                            filemode='a', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                            datefmt='%d-%b-%y %H:%M:%S %p', level=logging.INFO)
+        log_name = "current_extraction_log_{}.txt".format(timeout_duration)
+
+    handler = logging.handlers.RotatingFileHandler(log_name, mode='a', maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                                           datefmt='%d-%b-%y %H:%M:%S %p'))
+
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
 
 def convert_time(secs):
     """Converts seconds into days:hours:minutes:seconds
@@ -748,20 +1288,85 @@ def convert_time(secs):
     print("DAYS:HOURS:MIN:SEC")
     print("%d:%d:%d:%d" % (d.day-1, d.hour, d.minute, d.second))
 
+async def main_async(csv_in_name, csv_out_path, csv_index_name, timeout_duration, use_csv, use_db, make_csv,
+                     use_archive, concurrency, block, settle):
+    """Launches the browser once and extracts the network requests of every URL.
+
+    Parameters
+    ----------
+    csv_in_name : str
+        The CSV file containing current/archive URLs.
+    csv_out_path : str
+        The directory to store the CSV files containing network requests.
+    csv_index_name : str
+        The CSV file to store the extraction status of the URLs.
+    timeout_duration : int
+        Duration before timeout when going to each website.
+    use_csv : bool
+        Whether or not the input is a CSV file.
+    use_db : bool
+        Whether or not the input is a DB file.
+    make_csv : bool
+        Whether or not to output a CSV when use_db is True.
+    use_archive : bool
+        Whether or not the input is archive seeds. True is archive seeds, False is current seeds.
+    concurrency : int
+        The number of URLs extracted at the same time.
+    block : frozenset
+        The resource types whose requests are aborted instead of fetched.
+    settle : int
+        Seconds to keep recording after the DOM is loaded, None to wait for the network to be idle.
+
+    """
+
+    # Every URL shares one browser, on a pool of as many pages as URLs extracted at the same time
+    # Weird memory issue fix for pyppeteer (setting autoClose=False)
+    browser = await launch(headless=True, dumpio=True, autoClose=False)
+
+    # One session checks every URL, keeping connections to the same hosts open
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    # The CSV files are written in the background
+    file_thread = FileThread()
+
+    try:
+        pages = PagePool(browser, block)
+        await pages.open(concurrency)
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            if use_csv:
+                await create_with_csv(pages, session, file_thread, csv_in_name, csv_out_path, csv_index_name,
+                                      timeout_duration, use_archive, concurrency, block, settle)
+            if use_db:
+                await create_with_db(pages, session, file_thread, csv_out_path, csv_index_name, timeout_duration,
+                                     make_csv, use_archive, concurrency, block, settle)
+    finally:
+        try:
+            file_thread.stop()         # writes the remaining rows
+        finally:
+            await browser.close()
+
 def main():
     csv_in_name, csv_out_path, csv_index_name, \
-            timeout_duration, use_csv, use_db, make_csv, use_archive = parse_args()
+            timeout_duration, use_csv, use_db, make_csv, use_archive, concurrency, block, \
+            settle, profile = parse_args()
     set_up_logging(use_archive, timeout_duration)
 
+    # Tracing every allocation slows the run down, so it is only done when profiling
+    if profile:
+        tracemalloc.start()
+
     print("Extracting network requests...")
-    if use_csv:
-        create_with_csv(csv_in_name, csv_out_path, csv_index_name, timeout_duration, use_archive)
-    if use_db:
-        create_with_db(csv_out_path, csv_index_name, timeout_duration, make_csv, use_archive)
 
-tracemalloc.start()
+    # Every URL is extracted in this one run of the event loop
+    asyncio.get_event_loop().run_until_complete(
+            main_async(csv_in_name, csv_out_path, csv_index_name, timeout_duration, use_csv, use_db, make_csv,
+                       use_archive, concurrency, block, settle))
+
+    if profile:
+        snapshot = tracemalloc.take_snapshot()
+        display_top(snapshot)
+
 start_time = time.time()
 main()
 convert_time(int(time.time() - start_time))
-snapshot = tracemalloc.take_snapshot()
-display_top(snapshot)
@@ -3,6 +3,27 @@ import argparse
 import csv
 import os
 
+# Number of rows written to the output CSV at a time
+WRITE_BATCH_SIZE = 10000
+
+# Header of the output CSV, already quoted like csv.QUOTE_ALL
+HEADER = '"current_url","archive_url","current_file_name","archive_file_name"\r\n'
+
+def write_rows(csv_file_out, rows):
+    """Writes the rows to the output file, quoted the same way as csv.QUOTE_ALL.
+
+    Parameters
+    ----------
+    csv_file_out : file
+        The output CSV file.
+    rows : list
+        The (current_url, archive_url, current_file_name, archive_file_name) tuples to write.
+
+    """
+
+    csv_file_out.write(''.join(['"' + '","'.join([field.replace('"', '""') for field in row]) + '"\r\n'
+                                for row in rows]))
+
 def open_with_csv(curr_csv_name, arch_csv_name, csv_out_name, do_print):
     """Parse both index files line by line and writes the urls and file names to the output file.
 
@@ -19,55 +40,66 @@ def open_with_csv(curr_csv_name, arch_csv_name, csv_out_name, do_print):
 
     """
 
-    with open(curr_csv_name, 'r') as curr_csv_file:
+    with open(curr_csv_name, 'r', newline='', buffering=1048576) as curr_csv_file:
         curr_csv_reader = csv.reader(curr_csv_file)
-        with open(arch_csv_name, 'r') as arch_csv_file:
+        with open(arch_csv_name, 'r', newline='', buffering=1048576) as arch_csv_file:
             arch_csv_reader = csv.reader(arch_csv_file)
 
-            with open(csv_out_name, 'w+') as csv_file_out:
-                csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
-                csv_writer.writerow(['current_url', 'archive_url', 'current_file_name', 'archive_file_name'])
+            with open(csv_out_name, 'w', newline='', buffering=1048576) as csv_file_out:
+                csv_file_out.write(HEADER)
+
+                batch = []
+
+                # Bound once instead of looking the format method up for every match
+                format_current = "{0}.{1}.csv".format
+                format_archive = "{0}.{1}.{2}.csv".format
 
                 # Skip header
                 next(curr_csv_reader)
                 next(arch_csv_reader)
-                
-                # First row in index files
-                crow = next(curr_csv_reader)
-                arow = next(arch_csv_reader)
+
+                # Only successfully extracted urls can be paired, the others are skipped before the
+                # merge with the url ID already parsed
+                curr_rows = ((crow[0], int(crow[1]), crow[2]) for crow in curr_csv_reader
+                             if crow[-1] == "Extraction successful")
+                arch_rows = ((arow[0], int(arow[1]), arow[2], arow[3]) for arow in arch_csv_reader
+                             if arow[-1] == "Extraction successful")
 
                 try:
-                    while True:
+                    # First row in index files
+                    carchive_id, curl_id, curl = next(curr_rows)
+                    aarchive_id, aurl_id, adate, aurl = next(arch_rows)
 
-                        [carchive_id, curl_id, curl] = crow[:3]
-                        cextraction_status = crow[-1]
-                        [aarchive_id, aurl_id, adate, aurl] = arow[:4]
-                        aextraction_status = arow[-1]
-                        
-                        curl_id = int(curl_id)
-                        aurl_id = int(aurl_id)
+                    while True:
 
                         # Increments archive index
-                        if curl_id > aurl_id or aextraction_status != "Extraction successful":
-                            arow = next(arch_csv_reader)
+                        if curl_id > aurl_id:
+                            aarchive_id, aurl_id, adate, aurl = next(arch_rows)
                         # Increments current index
-                        elif curl_id < aurl_id or cextraction_status != "Extraction successful":
-                            crow = next(curr_csv_reader)
+                        elif curl_id < aurl_id:
+                            carchive_id, curl_id, curl = next(curr_rows)
                         # Found matching url
                         else:
-                            current_filename = "{0}.{1}.csv".format(carchive_id, curl_id)
-                            archive_filename = "{0}.{1}.{2}.csv".format(aarchive_id, aurl_id, adate)
+                            current_filename = format_current(carchive_id, curl_id)
+                            archive_filename = format_archive(aarchive_id, aurl_id, adate)
+
+                            match = (curl, aurl, current_filename, archive_filename)
+                            batch.append(match)
 
-                            csv_writer.writerow([curl, aurl, current_filename, archive_filename])
+                            if len(batch) >= WRITE_BATCH_SIZE:
+                                write_rows(csv_file_out, batch)
+                                batch.clear()
 
                             if do_print:
-                                print("{0}, {1}, {2}, {3}".format(curl, aurl, current_filename, archive_filename))
+                                print(", ".join(match))
                             # Checks if next element in archive index is the same url captured on a different date
-                            arow = next(arch_csv_reader)
+                            aarchive_id, aurl_id, adate, aurl = next(arch_rows)
 
                 except StopIteration:
                     pass
 
+                write_rows(csv_file_out, batch)
+
 def open_with_db(csv_out_name, do_print):
     """Gets the url and file names using a sql query and writing it to CSV
 
@@ -80,7 +112,46 @@ def open_with_db(csv_out_name, do_print):
 
     """
 
-    pass
+    for table in ["current_extraction_status", "archive_extraction_status"]:
+        cursor.execute("SELECT count(name) FROM sqlite_master WHERE type='table' AND name=?;", (table,))
+
+        if cursor.fetchone()[0] != 1:
+            print("Missing table aborting...")
+            connection.close()
+            exit()
+
+    # Lets SQLite look up the captures of each url instead of scanning the archive table
+    cursor.execute("CREATE INDEX IF NOT EXISTS current_extraction_status_url ON current_extraction_status "
+                   "(archiveID, urlID);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive_extraction_status_url ON archive_extraction_status "
+                   "(archiveID, urlID);")
+    connection.commit()
+
+    # The pairs and their file names are built by the join, rows are only passed through to the CSV
+    cursor.execute("SELECT c.url, a.url, c.archiveID || '.' || c.urlID || '.csv', "
+                   "a.archiveID || '.' || a.urlID || '.' || a.date || '.csv' "
+                   "FROM current_extraction_status AS c JOIN archive_extraction_status AS a "
+                   "ON a.archiveID = c.archiveID AND a.urlID = c.urlID "
+                   "WHERE c.extractionMessage = 'Extraction successful' "
+                   "AND a.extractionMessage = 'Extraction successful' "
+                   "ORDER BY c.archiveID, c.urlID, a.date;")
+
+    with open(csv_out_name, 'w', newline='', buffering=1048576) as csv_file_out:
+        csv_file_out.write(HEADER)
+        csv_writer = csv.writer(csv_file_out, delimiter=',', quoting=csv.QUOTE_ALL)
+
+        rows = cursor.fetchmany(WRITE_BATCH_SIZE)
+
+        while rows:
+            csv_writer.writerows(rows)
+
+            if do_print:
+                for row in rows:
+                    print(", ".join(row))
+
+            rows = cursor.fetchmany(WRITE_BATCH_SIZE)
+
+    connection.close()
 
 def parse_args():
     """Parses the command line arguments
@@ -156,7 +227,13 @@ def connect_sql(path):
 
     connection = sqlite3.connect(path)
     cursor = connection.cursor()
-    connection.commit()
+
+    # Same settings as the scripts filling the DB, the cache and temporary tables stay in memory
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.execute("PRAGMA cache_size=-65536;")          # 64 MiB
+    cursor.execute("PRAGMA mmap_size=268435456;")        # 256 MiB
 
 def main():
     csv_out_name, curr_csv_name, arch_csv_name, use_csv, use_db, do_print = parse_args()